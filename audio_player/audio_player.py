@@ -1,27 +1,92 @@
+import collections
+import heapq
 import logging
+import struct
+import shutil
+import signal
 import threading
 import subprocess
-import tempfile
 from concurrent.futures import ThreadPoolExecutor
 import os
 import time
+from utils.utils import get_env_var
 
 logger = logging.getLogger(__name__)
 
+# WAV sample width (bytes) -> raw sample format names understood by pw-play / paplay
+_PW_FORMATS = {1: "u8", 2: "s16", 4: "s32"}
+_PA_FORMATS = {1: "u8", 2: "s16le", 4: "s32le"}
+
+
+def _pipewire_cmd(fmt: tuple[int, int, int]) -> list[str]:
+    """pw-play command that plays raw PCM of the given format from stdin"""
+    channels, sample_width, rate = fmt
+    return ["pw-play", "--raw", f"--format={_PW_FORMATS[sample_width]}",
+            f"--rate={rate}", f"--channels={channels}", "--volume=6.0", "-"]
+
+def _pulse_cmd(fmt: tuple[int, int, int]) -> list[str]:
+    """paplay command that plays raw PCM of the given format from stdin"""
+    channels, sample_width, rate = fmt
+    return ["paplay", "--raw", f"--format={_PA_FORMATS[sample_width]}",
+            f"--rate={rate}", f"--channels={channels}", "--volume=100000"]
+
+# Backend name -> (tool binary, raw PCM command builder, ambient track command at low volume)
+_BACKENDS = {
+    "pipewire": ("pw-play", _pipewire_cmd, lambda path: ["pw-play", "--volume=0.3", path]),
+    "pulse": ("paplay", _pulse_cmd, lambda path: ["paplay", "--volume=16384", path]),
+}
+
+def _autodetect_backend() -> str | None:
+    """Pick the first backend whose tool is installed, preferring PipeWire"""
+    for name, (tool, _, _) in _BACKENDS.items():
+        if shutil.which(tool):
+            return name
+    return None
+
+# Chosen once at import; set AUDIO_BACKEND=pipewire|pulse to override detection
+PLAYBACK_BACKEND = get_env_var("AUDIO_BACKEND", None) or _autodetect_backend()
+
+# Reusable PCM slabs: 1 MiB holds ~20 s of 24 kHz mono s16, longer than any commentary clip
+SLAB_BYTES = 1 << 20
+POOL_SIZE = 8
+
 class OrderedAudioPlayer:
     """Ensures audio is played sequentially in ascending id order regardless of arrival order.
     
     Optimized for Ubuntu 24.04 with PipeWire - avoids simpleaudio completely.
     """
 
-    def __init__(self, min_duration: float = 1.0, max_duration: float = 2.0):
+    def __init__(self, min_duration: float = 1.0, max_duration: float = 2.0,
+                 max_pending: int = 32, gap_timeout: float = 3.0):
         self.min_duration = min_duration
         self.max_duration = max_duration
-        self._pending: dict[int, bytes] = {}
+        self.max_pending = max_pending  # clips buffered before producers get backpressure
+        self.gap_timeout = gap_timeout  # seconds to wait for a missing id before skipping it
+        self._pending: dict[int, tuple[tuple[int, int, int] | None, bytearray, int]] = {}
+        self._order: list[int] = []  # min-heap of the ids in _pending, so the head is the smallest queued id
         self._next_id: int | None = None  # will be set when first audio arrives
         self._lock = threading.Lock()
         self._not_empty = threading.Condition(self._lock)
         self._shutdown = False
+
+        # Bind the backend selected at import, so playback never fails over per clip
+        if PLAYBACK_BACKEND is None:
+            raise RuntimeError("Neither pw-play nor paplay found - install pipewire-utils or pulseaudio-utils")
+        if PLAYBACK_BACKEND not in _BACKENDS:
+            raise RuntimeError(f"Unknown AUDIO_BACKEND '{PLAYBACK_BACKEND}', expected one of {list(_BACKENDS)}")
+        self._backend, self._player_cmd, ambient_cmd = _BACKENDS[PLAYBACK_BACKEND]
+
+        # WAV format cache: TTS clips all share one format, so the fmt chunk is decoded once
+        self._fmt_chunk: bytes | None = None
+        self._fmt: tuple[int, int, int] | None = None
+
+        # Pool of preallocated PCM buffers, recycled after each clip is played
+        self._pool_lock = threading.Lock()
+        self._pool = collections.deque(bytearray(SLAB_BYTES) for _ in range(POOL_SIZE))
+        
+        # Long-lived player process fed raw PCM over stdin, owned by the worker thread
+        self._stream: subprocess.Popen | None = None
+        self._stream_fmt: tuple[int, int, int] | None = None
         
         # Single thread executor to guarantee sequential playbook
         self._executor = ThreadPoolExecutor(max_workers=1)
@@ -29,17 +94,20 @@ class OrderedAudioPlayer:
         
         # Ambient sound playback
         self._ambient_sound_path = os.path.join(os.path.dirname(__file__), "ambient_sound.wav")
+        self._ambient_cmd = ambient_cmd(self._ambient_sound_path)
         self._ambient_process = None
-        self._ambient_thread = None
         self._start_ambient_sound()
         
-        logger.info("✅ OrderedAudioPlayer initialized (PipeWire mode)")
+        logger.info(f"✅ OrderedAudioPlayer initialized ({self._backend} backend)")
+
+    def process(self, req_id: str, audio: bytes | memoryview) -> bool:
+        """Enqueue audio; playback starts when its turn comes.
 
-    def process(self, req_id: str, audio: bytes):
-        """Enqueue audio; playback starts when its turn comes."""
+        Returns False when the pending queue is full so the caller can throttle.
+        """
         if self._shutdown:
             logger.warning("Player is shutting down, ignoring audio request")
-            return
+            return True
             
         try:
             audio_id = int(req_id)
@@ -47,18 +115,49 @@ class OrderedAudioPlayer:
             logger.warning("Received non-integer id '%s', using sequential ID", req_id)
             audio_id = self._next_id if self._next_id is not None else 0
 
+        # Locate the PCM frames inside the WAV container so the worker only streams raw PCM.
+        # Invalid payloads still take their slot so the sequence keeps advancing.
+        try:
+            fmt, pcm = self._parse_wav(audio)
+        except ValueError as e:
+            logger.error("❌ Invalid WAV payload for audio id=%s: %s", audio_id, e)
+            fmt, pcm = None, b""
+
+        # Copy the samples into a pooled slab instead of keeping a fresh buffer alive
+        length = len(pcm)
+        buf = self._acquire(length)
+        buf[:length] = pcm
+
         with self._not_empty:
             # Record first id as the starting point
             if self._next_id is None:
                 self._next_id = audio_id
                 logger.info(f"🎯 Starting sequence with ID {audio_id}")
 
+            if audio_id < self._next_id:
+                # Its slot was already skipped or played; playing it now would break the order
+                logger.warning("🗑️  Dropping late audio ID %d (next is %d)", audio_id, self._next_id)
+                self._release(buf)
+                return True
+
             if audio_id in self._pending:
                 logger.warning("Duplicate audio id=%s received, overwriting", audio_id)
+                self._release(self._pending[audio_id][1])
+            elif len(self._pending) >= self.max_pending:
+                logger.warning("⏳ Pending queue full (%d), rejecting audio ID %d", len(self._pending), audio_id)
+                self._release(buf)
+                return False
+            else:
+                heapq.heappush(self._order, audio_id)
             
-            self._pending[audio_id] = audio
-            logger.debug(f"📦 Queued audio ID {audio_id} ({len(audio)} bytes)")
-            self._not_empty.notify()
+            # The worker only needs waking for the id it's blocked on, or to start its gap
+            # timer when the queue was idle; anything else is picked up after the current clip
+            was_idle = not self._pending
+            self._pending[audio_id] = (fmt, buf, length)
+            logger.debug("📦 Queued audio ID %d (%d bytes)", audio_id, length)
+            if audio_id == self._next_id or was_idle:
+                self._not_empty.notify()
+        return True
 
     def shutdown(self):
         """Gracefully shutdown the player"""
@@ -68,8 +167,9 @@ class OrderedAudioPlayer:
         # Stop ambient sound first
         self._stop_ambient_sound()
         
+        # _pending has exactly one consumer (the worker), so waking one waiter is enough
         with self._not_empty:
-            self._not_empty.notify_all()
+            self._not_empty.notify()
         
         # Wait for worker to finish
         try:
@@ -78,6 +178,9 @@ class OrderedAudioPlayer:
             logger.warning(f"Worker shutdown timeout: {e}")
         
         self._executor.shutdown(wait=True)
+        
+        # Let the player finish whatever is still buffered, then reap it
+        self._close_stream()
         logger.info("✅ OrderedAudioPlayer shutdown complete")
 
     def _worker(self):
@@ -88,26 +191,52 @@ class OrderedAudioPlayer:
             try:
                 # Wait for next audio in sequence
                 with self._not_empty:
+                    gap_since = None
                     while (not self._shutdown and 
-                           (self._next_id is None or self._next_id not in self._pending)):
-                        self._not_empty.wait(timeout=1.0)
+                           (not self._order or self._order[0] != self._next_id)):
+                        if not self._order:
+                            # Nothing queued: sleep until process() or shutdown() notifies
+                            gap_since = None
+                            self._not_empty.wait()
+                            continue
+                        now = time.monotonic()
+                        if gap_since is None:
+                            gap_since = now
+                        remaining = self.gap_timeout - (now - gap_since)
+                        if remaining <= 0:
+                            # Later clips are waiting on an id that never arrived: skip ahead
+                            skip_to = self._order[0]
+                            logger.warning("⏭️  Audio ID %d missing for %ss, skipping to ID %d",
+                                           self._next_id, self.gap_timeout, skip_to)
+                            self._next_id = skip_to
+                            break
+                        self._not_empty.wait(timeout=remaining)
                     
                     if self._shutdown:
                         break
                     
                     # Get the next audio to play
-                    audio = self._pending.pop(self._next_id)
+                    heapq.heappop(self._order)
+                    fmt, buf, length = self._pending.pop(self._next_id)
                     current_id = self._next_id
                     self._next_id += 1
 
-                # Play the audio
-                logger.info(f"🔊 Playing audio ID {current_id} ({len(audio)} bytes)")
-                success = self._play_audio_pipewire(audio, current_id)
+                try:
+                    if fmt is None:
+                        logger.warning("⏭️  Skipping undecodable audio ID %d", current_id)
+                        continue
+
+                    # Play the audio
+                    logger.info("🔊 Playing audio ID %d (%d bytes)", current_id, length)
+                    with memoryview(buf) as view:
+                        success = self._play_audio(view[:length], fmt, current_id)
+                finally:
+                    self._release(buf)
                 
                 if success:
-                    logger.info(f"✅ Completed audio ID {current_id}")
+                    logger.info("✅ Completed audio ID %d", current_id)
                 else:
-                    logger.error(f"❌ Failed to play audio ID {current_id}")
+                    logger.error("❌ Failed to play audio ID %d", current_id)
                     
             except Exception as e:
                 logger.error(f"❌ Worker error: {e}")
@@ -117,172 +246,165 @@ class OrderedAudioPlayer:
 
         logger.info("🎵 Audio worker thread stopped")
 
-    def _play_audio_pipewire(self, audio: bytes, audio_id: int) -> bool:
+    def _acquire(self, size: int) -> bytearray:
+        """Check out a PCM buffer of at least ``size`` bytes from the pool"""
+        if size <= SLAB_BYTES:
+            with self._pool_lock:
+                if self._pool:
+                    return self._pool.pop()
+            return bytearray(SLAB_BYTES)
+        # Oversized clip: allocate exactly what it needs, it won't be pooled
+        return bytearray(size)
+
+    def _release(self, buf: bytearray):
+        """Return a slab to the pool, dropping it if the pool is already full"""
+        if len(buf) != SLAB_BYTES:
+            return
+        with self._pool_lock:
+            if len(self._pool) < POOL_SIZE:
+                self._pool.append(buf)
+
+    def _parse_wav(self, audio: bytes | memoryview) -> tuple[tuple[int, int, int], memoryview]:
         """
-        Play audio using PipeWire (pw-play) - primary method for Ubuntu 24.04
+        Walk the RIFF chunks of a WAV payload and return its (channels, sample width, rate)
+        format plus a zero-copy view of the PCM frames in the data chunk
         """
-        temp_file = None
+        audio = memoryview(audio)
+        if len(audio) < 12 or audio[:4] != b"RIFF" or audio[8:12] != b"WAVE":
+            raise ValueError("not a RIFF/WAVE payload")
+
+        fmt = None
+        offset = 12
+        while offset + 8 <= len(audio):
+            chunk_id = audio[offset:offset + 4]
+            (chunk_size,) = struct.unpack_from("<I", audio, offset + 4)
+            body = offset + 8
+
+            if chunk_id == b"fmt ":
+                fmt_chunk = audio[body:body + 16]
+                if fmt_chunk != self._fmt_chunk:
+                    if len(fmt_chunk) < 16:
+                        raise ValueError("truncated fmt chunk")
+                    tag, channels, rate, _, _, bits = struct.unpack("<HHIIHH", fmt_chunk)
+                    if tag not in (1, 0xFFFE) or (bits + 7) // 8 not in _PW_FORMATS:
+                        raise ValueError(f"unsupported WAV encoding (tag={tag}, bits={bits})")
+                    if self._fmt_chunk is not None:
+                        logger.info(f"🔄 Audio format changed to {channels}ch/{bits}bit/{rate}Hz")
+                    # Copy so the cache doesn't pin the whole request buffer
+                    self._fmt_chunk = bytes(fmt_chunk)
+                    self._fmt = (channels, (bits + 7) // 8, rate)
+                fmt = self._fmt
+
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError("data chunk before fmt chunk")
+                # Streaming writers may leave the size unset, so clamp to the payload
+                end = min(body + chunk_size, len(audio))
+                return fmt, audio[body:end]
+
+            # Chunks are word aligned
+            offset = body + chunk_size + (chunk_size & 1)
+
+        raise ValueError("no data chunk found")
+
+    def _open_stream(self, fmt: tuple[int, int, int]) -> subprocess.Popen:
+        """Return the long-lived player process for ``fmt``, (re)spawning it if needed"""
+        stream = self._stream
+        if stream is not None and stream.poll() is None and self._stream_fmt == fmt:
+            return stream
+
+        if stream is not None:
+            if stream.poll() is not None:
+                logger.warning(f"🔄 {self._backend} stream exited (code {stream.returncode}), respawning")
+            else:
+                logger.info(f"🔄 Reopening {self._backend} stream for format {fmt}")
+            self._close_stream()
+
+        self._stream = subprocess.Popen(
+            self._player_cmd(fmt),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        self._stream_fmt = fmt
+        logger.debug(f"🎧 Opened {self._backend} stream for format {fmt}")
+        return self._stream
+
+    def _close_stream(self, drain: bool = True):
+        """Close the player's stdin so it drains what was written, then reap it; ``drain=False`` kills it outright"""
+        stream, self._stream = self._stream, None
+        if stream is None:
+            return
         try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_wav:
-                tmp_wav.write(audio)
-                tmp_wav.flush()
-                temp_file = tmp_wav.name
-
-            # Play with pw-play
-            result = subprocess.run(
-                ["pw-play", "--volume=6.0", temp_file],
-                check=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.PIPE,
-                timeout=30
-            )
-            
-            return True
-            
+            stream.stdin.close()
+        except (OSError, ValueError):
+            pass
+        if not drain:
+            stream.kill()
+            stream.wait()
+            return
+        try:
+            stream.wait(timeout=30)
         except subprocess.TimeoutExpired:
-            logger.error(f"❌ Audio playback timeout for ID {audio_id}")
-            return False
-            
-        except FileNotFoundError:
-            logger.error("❌ pw-play not found - install pipewire-utils")
-            return self._play_audio_fallback(audio, audio_id)
-            
-        except subprocess.CalledProcessError as e:
-            logger.error(f"❌ pw-play failed for ID {audio_id}: {e}")
-            return self._play_audio_fallback(audio, audio_id)
-            
-        except Exception as e:
-            logger.error(f"❌ Unexpected error playing audio ID {audio_id}: {e}")
-            return self._play_audio_fallback(audio, audio_id)
-            
-        finally:
-            # Clean up temporary file
-            if temp_file:
-                try:
-                    os.unlink(temp_file)
-                except:
-                    pass
+            logger.warning(f"🔇 {self._backend} stream did not drain, killing it")
+            stream.kill()
 
-    def _play_audio_fallback(self, audio: bytes, audio_id: int) -> bool:
+    def _play_audio(self, pcm: memoryview, fmt: tuple[int, int, int], audio_id: int) -> bool:
         """
-        Fallback audio playback using paplay
+        Play raw PCM with the backend probed at startup (pw-play on Ubuntu 24.04, else paplay)
+
+        The samples are written into the stdin of one long-lived raw-mode player
+        process, so the audio client connection is set up once rather than per clip.
+        The pipe applies backpressure, keeping the worker paced with playback.
         """
-        temp_file = None
-        try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_wav:
-                tmp_wav.write(audio)
-                tmp_wav.flush()
-                temp_file = tmp_wav.name
-
-            # Try paplay as fallback
-            result = subprocess.run(
-                ["paplay", "--volume=100000", temp_file],
-                check=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.PIPE,
-                timeout=30
-            )
-            
-            logger.info(f"✅ Fallback paplay succeeded for ID {audio_id}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Fallback paplay also failed for ID {audio_id}: {e}")
-            return False
-            
-        finally:
-            # Clean up temporary file
-            if temp_file:
-                try:
-                    os.unlink(temp_file)
-                except:
-                    pass
+        for attempt in range(2):
+            stream = self._open_stream(fmt)
+            try:
+                stream.stdin.write(pcm)
+                stream.stdin.flush()
+                return True
+            except (BrokenPipeError, ValueError) as e:
+                # The player died mid-write; drop it (it may not be reaped yet) so the retry respawns it
+                logger.error("❌ %s stream broke while playing ID %d: %s", self._backend, audio_id, e)
+                self._close_stream(drain=False)
+            except Exception as e:
+                logger.error("❌ Unexpected error playing audio ID %d: %s", audio_id, e)
+                return False
+        return False
 
     def _start_ambient_sound(self):
-        """Start continuous ambient sound playback in a separate thread"""
+        """Start continuous ambient sound playback as a separate, self-looping player client"""
         if not os.path.exists(self._ambient_sound_path):
             logger.warning(f"❌ Ambient sound file not found: {self._ambient_sound_path}")
             return
         
         logger.info(f"🎶 Starting ambient sound: {self._ambient_sound_path}")
-        self._ambient_thread = threading.Thread(target=self._ambient_sound_worker, daemon=True)
-        self._ambient_thread.start()
+        try:
+            # The sound server mixes this stream with the commentary stream; a child shell
+            # restarts the track when it ends, so no Python thread has to babysit it
+            self._ambient_process = subprocess.Popen(
+                ["sh", "-c", 'while :; do "$@" || sleep 1; done', "ambient", *self._ambient_cmd],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True
+            )
+        except Exception as e:
+            logger.error(f"❌ Ambient sound error: {e}")
     
     def _stop_ambient_sound(self):
         """Stop ambient sound playback"""
-        if self._ambient_process:
+        process, self._ambient_process = self._ambient_process, None
+        if process:
             try:
-                self._ambient_process.terminate()
-                self._ambient_process.wait(timeout=3.0)
+                # Signal the whole session so the loop shell and the current player both exit
+                os.killpg(process.pid, signal.SIGTERM)
+                process.wait(timeout=3.0)
                 logger.info("🔇 Ambient sound stopped")
             except subprocess.TimeoutExpired:
                 logger.warning("🔇 Ambient sound process killed (timeout)")
-                self._ambient_process.kill()
+                os.killpg(process.pid, signal.SIGKILL)
+                process.wait()
+            except ProcessLookupError:
+                pass
             except Exception as e:
                 logger.error(f"❌ Error stopping ambient sound: {e}")
-            finally:
-                self._ambient_process = None
-    
-    def _ambient_sound_worker(self):
-        """Worker thread for continuous ambient sound playback"""
-        logger.info("🎶 Ambient sound worker thread started")
-        
-        while not self._shutdown:
-            try:
-                # Start ambient sound process with loop and lower volume
-                self._ambient_process = subprocess.Popen(
-                    ["pw-play", "--volume=0.3", self._ambient_sound_path],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.PIPE
-                )
-                
-                # Wait for process to finish or shutdown signal
-                while not self._shutdown and self._ambient_process.poll() is None:
-                    time.sleep(0.1)
-                
-                if self._shutdown:
-                    break
-                    
-                # If process ended naturally, restart it (continuous loop)
-                if self._ambient_process.poll() is not None:
-                    logger.debug("🔄 Restarting ambient sound")
-                    
-            except FileNotFoundError:
-                logger.error("❌ pw-play not found for ambient sound - trying fallback")
-                self._ambient_sound_fallback()
-                break
-                
-            except Exception as e:
-                logger.error(f"❌ Ambient sound error: {e}")
-                time.sleep(1.0)  # Wait before retry
-                
-        logger.info("🎶 Ambient sound worker thread stopped")
-    
-    def _ambient_sound_fallback(self):
-        """Fallback ambient sound using paplay"""
-        logger.info("🎶 Using paplay fallback for ambient sound")
-        
-        while not self._shutdown:
-            try:
-                self._ambient_process = subprocess.Popen(
-                    ["paplay", "--volume=16384", self._ambient_sound_path],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.PIPE
-                )
-                
-                # Wait for process to finish or shutdown signal
-                while not self._shutdown and self._ambient_process.poll() is None:
-                    time.sleep(0.1)
-                
-                if self._shutdown:
-                    break
-                    
-                # If process ended naturally, restart it (continuous loop)
-                if self._ambient_process.poll() is not None:
-                    logger.debug("🔄 Restarting ambient sound (fallback)")
-                    
-            except Exception as e:
-                logger.error(f"❌ Ambient sound fallback error: {e}")
-                time.sleep(1.0)  # Wait before retry
\ No newline at end of file
@@ -1,11 +1,11 @@
+import asyncio
 import logging
-from concurrent.futures import ThreadPoolExecutor
 import os
 os.environ["GRPC_VERBOSITY"] = "ERROR"
 import grpc
 from utils.discovery_utils import (
     get_env_var,
-    start_grpc_server_with_discovery
+    serve_grpc_aio_server_with_discovery
 )
 from utils.logging_config import setup_logging
 from proto import data_pb2, data_pb2_grpc
@@ -28,16 +28,21 @@ class ModuleDServicer(data_pb2_grpc.ModuleDServicer):
             logger.error(f"❌ Failed to initialize OrderedAudioPlayer: {e}")
             raise
 
-    def PlayAudio(self, request: data_pb2.Audio, context):  # noqa: N802
+    async def PlayAudio(self, request: data_pb2.Audio, context):  # noqa: N802
+        # process() only copies the clip into the ordered queue, so it is safe to call on the event loop
         try:
-            logger.info(f"📥 Received audio request (id={request.id}, data_size={len(request.audio_data)} bytes)")
-            logger.info(f"🔍 Client address: {context.peer()}")
+            logger.info("📥 Received audio request (id=%s, data_size=%d bytes)", request.id, len(request.audio_data))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("🔍 Client address: %s", context.peer())
             
-            self.player.process(request.id, request.audio_data)
-            logger.info(f"✅ Enqueued audio (id={request.id}) for playback")
+            # Hand over a view so the player copies the PCM straight from the request buffer
+            if not self.player.process(request.id, memoryview(request.audio_data)):
+                logger.warning("⏳ Player queue full, rejecting audio (id=%s)", request.id)
+                return data_pb2.BasicResponse(id=request.id, success=False, message="backpressure")
+            logger.info("✅ Enqueued audio (id=%s) for playback", request.id)
             
             response = data_pb2.BasicResponse(id=request.id, success=True, message="Audio scheduled")
-            logger.info(f"📤 Sending success response for id={request.id}")
+            logger.debug("📤 Sending success response for id=%s", request.id)
             return response
             
         except Exception as e:
@@ -52,19 +57,19 @@ class ModuleDServicer(data_pb2_grpc.ModuleDServicer):
             )
 
 
-def serve():
+async def serve():
     logger.info("🚀 Starting Module D gRPC server...")
     
     try:
-        server = grpc.server(ThreadPoolExecutor(max_workers=10))
+        server = grpc.aio.server()
         logger.info("✅ gRPC server instance created")
         
         servicer = ModuleDServicer()
         data_pb2_grpc.add_ModuleDServicer_to_server(servicer, server)
         logger.info("✅ ModuleDServicer added to server")
         
-        # Start server with discovery registration and graceful shutdown
-        start_grpc_server_with_discovery(
+        # Serve with discovery registration and graceful shutdown
+        await serve_grpc_aio_server_with_discovery(
             server=server,
             service_name=SERVICE_NAME,
             host_address=MODULE_D_HOST,
@@ -72,7 +77,8 @@ def serve():
                 "version": "1.0.0",
                 "type": "audio_player",
                 "description": "Plays audio streams"
-            }
+            },
+            on_shutdown=lambda: asyncio.to_thread(servicer.player.shutdown)
         )
         
     except Exception as e:
@@ -83,7 +89,7 @@ def serve():
 
 if __name__ == "__main__":
     try:
-        serve()
+        asyncio.run(serve())
     except KeyboardInterrupt:
         logger.info("🛑 Server interrupted by user")
     except Exception as e:
@@ -6,7 +6,11 @@ Acts as an online dictionary where modules can register and discover each other
 from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
+import asyncio
+from contextlib import asynccontextmanager
+import hmac
 import logging
+import time
 from typing import Dict, Optional
 import uvicorn
 import os
@@ -27,29 +31,64 @@ def get_api_key() -> str:
         raise ValueError("DISCOVERY_API_KEY environment variable must be set")
     return api_key
 
-def verify_api_key(credentials: HTTPAuthorizationCredentials = Depends(security)) -> bool:
+# Read once at startup; None means authentication is not configured
+try:
+    API_KEY: Optional[bytes] = get_api_key().encode()
+except ValueError as e:
+    logger.error(f"Authentication configuration error: {e}")
+    API_KEY = None
+
+async def verify_api_key(credentials: HTTPAuthorizationCredentials = Depends(security)) -> bool:
     """Verify the provided API key"""
-    try:
-        api_key = get_api_key()
-        if credentials.credentials != api_key:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid API key",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return True
-    except ValueError as e:
-        logger.error(f"Authentication configuration error: {e}")
+    if API_KEY is None:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Authentication not properly configured"
         )
+    # Constant-time comparison so response timing doesn't leak the key
+    if not hmac.compare_digest(credentials.credentials.encode(), API_KEY):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid API key",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return True
 
-app = FastAPI(title="Relator Discovery Service", version="1.0.0")
-
-# Simple in-memory dictionary to store service information
+# Simple in-memory dictionary to store service information.
+# Handlers are async and only touch it from the event loop thread, so no lock is needed
 services_registry: Dict[str, dict] = {}
 
+# Monotonic expiry deadline for services registered with a TTL; others never expire
+service_expirations: Dict[str, float] = {}
+SWEEP_INTERVAL = 15  # seconds between purges of expired registrations
+
+def is_expired(service_name: str, now: Optional[float] = None) -> bool:
+    """Whether a TTL-bound registration has missed its re-registration window"""
+    expires_at = service_expirations.get(service_name)
+    return expires_at is not None and expires_at <= (now if now is not None else time.monotonic())
+
+def purge_expired() -> None:
+    """Drop every registration whose TTL has elapsed"""
+    now = time.monotonic()
+    for service_name in [name for name in service_expirations if is_expired(name, now)]:
+        services_registry.pop(service_name, None)
+        del service_expirations[service_name]
+        logger.info(f"⌛ Expired service '{service_name}' (missed re-registration)")
+
+async def sweep_expired_services():
+    """Background task purging expired registrations"""
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        purge_expired()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    sweeper = asyncio.create_task(sweep_expired_services())
+    yield
+    sweeper.cancel()
+
+app = FastAPI(title="Relator Discovery Service", version="1.0.0", lifespan=lifespan)
+
 class ServiceInfo(BaseModel):
     """Service information model"""
     host: str
@@ -62,14 +101,15 @@ class ServiceRegistration(BaseModel):
     host: str
     port: int
     metadata: Optional[dict] = None
+    ttl_seconds: Optional[int] = None  # expire unless re-registered within this window
 
 @app.get("/")
-def root():
+async def root():
     """Health check endpoint (public - no auth required)"""
     return {"status": "Discovery Service is running", "registered_services": len(services_registry)}
 
 @app.post("/register")
-def register_service(registration: ServiceRegistration, _: bool = Depends(verify_api_key)):
+async def register_service(registration: ServiceRegistration, _: bool = Depends(verify_api_key)):
     """
     Register a service in the discovery registry
     
@@ -87,6 +127,10 @@ def register_service(registration: ServiceRegistration, _: bool = Depends(verify
     }
     
     services_registry[registration.service_name] = service_info
+    if registration.ttl_seconds:
+        service_expirations[registration.service_name] = time.monotonic() + registration.ttl_seconds
+    else:
+        service_expirations.pop(registration.service_name, None)
     
     logger.info(f"✅ Registered service '{registration.service_name}' at {service_info['endpoint']}")
     
@@ -97,7 +141,7 @@ def register_service(registration: ServiceRegistration, _: bool = Depends(verify
     }
 
 @app.get("/discover/{service_name}")
-def discover_service(service_name: str, _: bool = Depends(verify_api_key)):
+async def discover_service(service_name: str, _: bool = Depends(verify_api_key)):
     """
     Discover a service by name
     
@@ -110,7 +154,7 @@ def discover_service(service_name: str, _: bool = Depends(verify_api_key)):
     Raises:
         HTTPException: If service is not found
     """
-    if service_name not in services_registry:
+    if service_name not in services_registry or is_expired(service_name):
         logger.warning(f"❌ Service '{service_name}' not found in registry")
         raise HTTPException(status_code=404, detail=f"Service '{service_name}' not found")
     
@@ -123,13 +167,14 @@ def discover_service(service_name: str, _: bool = Depends(verify_api_key)):
     }
 
 @app.get("/services")
-def list_services(_: bool = Depends(verify_api_key)):
+async def list_services(_: bool = Depends(verify_api_key)):
     """
     List all registered services
     
     Returns:
         Dictionary of all registered services
     """
+    purge_expired()
     logger.info(f"📋 Listed all services: {list(services_registry.keys())}")
     return {
         "services": services_registry,
@@ -137,7 +182,7 @@ def list_services(_: bool = Depends(verify_api_key)):
     }
 
 @app.delete("/unregister/{service_name}")
-def unregister_service(service_name: str, _: bool = Depends(verify_api_key)):
+async def unregister_service(service_name: str, _: bool = Depends(verify_api_key)):
     """
     Unregister a service from the registry
     
@@ -154,6 +199,7 @@ def unregister_service(service_name: str, _: bool = Depends(verify_api_key)):
         raise HTTPException(status_code=404, detail=f"Service '{service_name}' not found")
     
     del services_registry[service_name]
+    service_expirations.pop(service_name, None)
     logger.info(f"🗑️  Unregistered service '{service_name}'")
     
     return {"message": f"Service '{service_name}' unregistered successfully"}
@@ -3,40 +3,48 @@ import subprocess
 from evdev import list_devices, InputDevice
 
 
+CONTROLLER_NAMES = frozenset(["Wireless Controller", "Microsoft X-Box 360 pad"])
+COMPOSE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "docker-compose.yml")
+CONTAINER_NAME = "gfootball"
+
+
+def getDeviceName(path: str) -> str:
+    # The kernel exposes the device name in sysfs, so no /dev/input node has to be opened
+    sysfsPath = f"/sys/class/input/{os.path.basename(path)}/device/name"
+    try:
+        with open(sysfsPath) as f:
+            return f.read().strip()
+    except OSError:
+        return InputDevice(path).name
+
+
 def getControllerPaths() -> list[str]:
-    return [path for path in list_devices()
-            if InputDevice(path).name in ["Wireless Controller", "Microsoft X-Box 360 pad"]]
+    return [path for path in list_devices() if getDeviceName(path) in CONTROLLER_NAMES]
 
 
-def buildDockerCommand(controllerPaths: list[str]) -> list[str]:
-    cmd = [
-        "docker", "run", "-it",
-        "-v", "/tmp/.X11-unix:/tmp/.X11-unix:rw",
+def buildComposeUpCommand() -> list[str]:
+    # No-op when the container is already running, so only the first game pays for startup
+    return ["docker", "compose", "-f", COMPOSE_FILE, "up", "-d"]
+
+
+def buildDockerExecCommand(controllerPaths: list[str]) -> list[str]:
+    # Controllers are reachable through the /dev/input bind mount, so only the
+    # player assignment depends on how many were found
+    return [
+        "docker", "exec", "-it",
         "-e", f"DISPLAY={os.environ['DISPLAY']}",
-        "--gpus", "all",
-        "--device", "/dev/snd:/dev/snd",
-        "-v", "/dev/dri:/dev/dri",
-        "-e", "PULSE_SERVER=unix:/tmp/pulse/native",
-        "-v", f"/run/user/{os.getuid()}/pulse:/tmp/pulse:ro",
-        "-v", f"{os.path.expanduser('~')}/.config/pulse/cookie:/root/.config/pulse/cookie:ro",
-        "-v", "./event_extractor/src:/gfootball",
-        "-v", ".env:/gfootball/.env:ro",
-    ]
-    for path in controllerPaths:
-        cmd.extend(["--device", path])
-    cmd.extend([
-        "gfootball",
+        CONTAINER_NAME,
         "python3", "/gfootball/commentate_game.py",
         f"--player1={'gamepad:left_players=1' if len(controllerPaths) >= 1 else 'bot:left_players=1'}",
         f"--player2={'gamepad:right_players=1' if len(controllerPaths) == 2 else 'bot:right_players=1'}",
-    ])
-    return cmd
+    ]
 
 
 def main() -> None:
     controllerPaths = getControllerPaths()
     assert len(controllerPaths) <= 2, "No more than 2 controllers are supported."
-    cmd = buildDockerCommand(controllerPaths)
+    subprocess.run(buildComposeUpCommand(), check=True)
+    cmd = buildDockerExecCommand(controllerPaths)
     subprocess.run(cmd)
 
 
@@ -3,8 +3,10 @@ Discovery Client SDK - Functions for service registration and discovery
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import logging
-from typing import Optional, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List
 from utils.utils import get_env_var
 
 # Configure logging
@@ -12,27 +14,38 @@ logger = logging.getLogger("Discovery Client")
 # Set client to DEBUG level - only shows detailed info when needed
 logger.setLevel(logging.DEBUG)
 
+# Discovery settings are read once at import time
+_DISCOVERY_URL = get_env_var("DISCOVERY_URL", None)
+_API_KEY = get_env_var("DISCOVERY_API_KEY", None)
+_AUTH_HEADERS = {
+    "Authorization": f"Bearer {_API_KEY}",
+    "Content-Type": "application/json"
+}
+
+# Shared session so discovery calls reuse pooled keep-alive connections
+_SESSION_POOL_SIZE = 16
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=_SESSION_POOL_SIZE))
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=_SESSION_POOL_SIZE))
+
 class DiscoveryError(Exception):
     """Custom exception for discovery service errors"""
     pass
 
 def get_auth_headers() -> Dict[str, str]:
     """Get authentication headers with API key"""
-    api_key = get_env_var("DISCOVERY_API_KEY", None)
-    if not api_key:
+    if not _API_KEY:
         raise DiscoveryError("DISCOVERY_API_KEY environment variable must be set")
     
-    return {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+    return _AUTH_HEADERS
 
 def register_service(
     service_name: str,
     service_host: str,
     service_port: int,
-    discovery_url: str = get_env_var("DISCOVERY_URL", None),
+    discovery_url: Optional[str] = None,
     metadata: Optional[Dict] = None,
+    ttl_seconds: Optional[int] = None,
 ) -> Dict:
     """
     Register a service with the discovery server
@@ -43,6 +56,7 @@ def register_service(
         service_host: IP/hostname where the service is running
         service_port: Port where the service is listening
         metadata: Optional metadata dictionary
+        ttl_seconds: Optional lifetime; the registration expires unless renewed in time
     
     Returns:
         Response from the discovery server
@@ -57,10 +71,13 @@ def register_service(
         "port": service_port,
         "metadata": metadata or {}
     }
+    if ttl_seconds:
+        registration_data["ttl_seconds"] = ttl_seconds
+    discovery_url = discovery_url or _DISCOVERY_URL
     
     try:
         headers = get_auth_headers()
-        response = requests.post(
+        response = _SESSION.post(
             f"{discovery_url}/register",
             json=registration_data,
             headers=headers,
@@ -79,7 +96,7 @@ def register_service(
 
 def discover_service(
     service_name: str,
-    discovery_url: str = get_env_var("DISCOVERY_URL", None),
+    discovery_url: Optional[str] = None,
 ) -> Dict:
     """
     Discover a service by name
@@ -94,11 +111,11 @@ def discover_service(
     Raises:
         DiscoveryError: If service is not found or discovery fails
     """
-    discovery_url = get_env_var("DISCOVERY_URL", None)
+    discovery_url = discovery_url or _DISCOVERY_URL
     
     try:
         headers = get_auth_headers()
-        response = requests.get(
+        response = _SESSION.get(
             f"{discovery_url}/discover/{service_name}",
             headers=headers,
             timeout=10
@@ -122,9 +139,36 @@ def discover_service(
         logger.error(error_msg)
         raise DiscoveryError(error_msg)
 
+def discover_services(
+    service_names: List[str],
+    discovery_url: Optional[str] = None,
+) -> Dict[str, Dict]:
+    """
+    Discover several services concurrently
+    
+    Lookups run in parallel over the shared session, so startup pays roughly one
+    round-trip instead of one per service.
+    
+    Args:
+        service_names: Names of the services to discover
+        discovery_url: URL of the discovery server
+    
+    Returns:
+        Dictionary mapping each service name to its service information
+    
+    Raises:
+        DiscoveryError: If any service is not found or discovery fails
+    """
+    if not service_names:
+        return {}
+    
+    with ThreadPoolExecutor(max_workers=min(len(service_names), _SESSION_POOL_SIZE)) as executor:
+        results = executor.map(lambda name: discover_service(name, discovery_url), service_names)
+        return dict(zip(service_names, results))
+
 def get_service_endpoint(
     service_name: str,
-    discovery_url: str = get_env_var("DISCOVERY_URL", None),
+    discovery_url: Optional[str] = None,
 ) -> str:
     """
     Get the endpoint (host:port) for a service
@@ -143,7 +187,7 @@ def get_service_endpoint(
     return service_info["endpoint"]
 
 def list_all_services(
-    discovery_url: str = get_env_var("DISCOVERY_URL", None),
+    discovery_url: Optional[str] = None,
 ) -> Dict:
     """
     List all registered services
@@ -157,9 +201,11 @@ def list_all_services(
     Raises:
         DiscoveryError: If request fails
     """
+    discovery_url = discovery_url or _DISCOVERY_URL
+    
     try:
         headers = get_auth_headers()
-        response = requests.get(
+        response = _SESSION.get(
             f"{discovery_url}/services",
             headers=headers,
             timeout=10
@@ -177,7 +223,7 @@ def list_all_services(
 
 def unregister_service(
     service_name: str,
-    discovery_url: str = get_env_var("DISCOVERY_URL", None),
+    discovery_url: Optional[str] = None,
 ) -> Dict:
     """
     Unregister a service from the discovery server
@@ -191,10 +237,11 @@ def unregister_service(
     Raises:
         DiscoveryError: If unregistration fails
     """
+    discovery_url = discovery_url or _DISCOVERY_URL
 
     try:
         headers = get_auth_headers()
-        response = requests.delete(
+        response = _SESSION.delete(
             f"{discovery_url}/unregister/{service_name}",
             headers=headers,
             timeout=10
@@ -1,7 +1,11 @@
 from enum import Enum
-import json
-from time import sleep, perf_counter
+from functools import lru_cache
+import mmap
+import sys
+from time import perf_counter
+from typing import List
 import numpy as np
+import orjson
 
 
 from send_event import EventSender
@@ -10,6 +14,59 @@ from send_event import EventSender
 FIELD_HALF_LENGTH = 1.0
 FIELD_HALF_WIDTH = 0.42
 GOAL_HALF_WIDTH = 0.044
+METADATA_PATH = "/gfootball/metadata.json"
+MATCH_SECONDS = 90 * 60
+GOALKEEPER_POSITION = "POR"  # short_position of keepers in metadata.json
+END_OF_MATCH_FLUSH_TIMEOUT = 10.0  # seconds to wait for Module B to take the final events
+
+_DIRECTIONAL_ACTIONS = frozenset({
+    "action_left",
+    "action_top_left",
+    "action_top",
+    "action_top_right",
+    "action_right",
+    "action_bottom_right",
+    "action_bottom",
+    "action_bottom_left"
+})
+_PASS_ACTIONS = frozenset({
+    "short_pass",
+    "long_pass",
+    "high_pass"
+})
+_KICK_ACTIONS = _PASS_ACTIONS | {"shot"}
+_LOCATION_TABLE = tuple(
+    tuple(f"{x_description}__{y_description}" for y_description in (
+        "banda superior",
+        "medio de la cancha (de arriba a abajo)",
+        "banda inferior"
+    ))
+    for x_description in (
+        "tercio izquierdo de la cancha",
+        "centro de la cancha (de izquierda a derecha)",
+        "tercio derecho de la cancha"
+    )
+)  # [x third][y third]
+_X_THIRDS = 1.5 / FIELD_HALF_LENGTH  # (x + HALF) / (2 * HALF) * 3 folded into one factor
+_Y_THIRDS = 1.5 / FIELD_HALF_WIDTH
+_FLAG_KEYS = ("left_team_yellow_card", "right_team_yellow_card", "left_team_active", "right_team_active")
+
+
+@lru_cache(maxsize=None)
+def _load_metadata(path: str) -> dict:
+    """Parse the match metadata once per process; every EventExtractor shares the dict."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        with memoryview(mm) as view:
+            metadata = orjson.loads(view)
+    # Team names are compared every step; interned, equal names are the same object
+    for team in (metadata["left_team"], metadata["right_team"]):
+        team["name"] = sys.intern(team["name"])
+    return metadata
+
+
+def _new_flags(curr: np.ndarray, prev: np.ndarray) -> np.ndarray:
+    """Indices of the players whose flag is set in curr but not in prev."""
+    return np.flatnonzero(np.logical_and(curr, np.logical_not(prev)))
 
 
 class GameMode(Enum):
@@ -22,32 +79,58 @@ class GameMode(Enum):
     PENALTY = 6
 
 
-gameModeMap = {
-    0: "normal",
-    1: "saque_del_medio",
-    2: "saque_de_arco",
-    3: "tiro_libre",
-    4: "córner",
-    5: "saque_lateral",
-    6: "penal"
-}
+# Indexed by the raw obs["game_mode"] int
+gameModeMap = (
+    "normal",
+    "saque_del_medio",
+    "saque_de_arco",
+    "tiro_libre",
+    "córner",
+    "saque_lateral",
+    "penal"
+)
+# obs["game_mode"] is a plain int, so compare against the enum values rather than the members
+_EXCLUDED_MODES = frozenset({GameMode.NORMAL.value, GameMode.KICKOFF.value})
+
+
+class _PlayState:
+    """Who had the ball, where and when: the open half of a pass/shot, or the previous possession."""
+    __slots__ = ("equipo", "jugador", "ubicacion", "match_time", "subtype")
+
+    def __init__(self, equipo: str, jugador: dict, ubicacion: str, match_time: float = None, subtype: str = None):
+        self.equipo = equipo
+        self.jugador = jugador
+        self.ubicacion = ubicacion
+        self.match_time = match_time
+        self.subtype = subtype
 
 
 class EventExtractor:
     def __init__(self):
         # Load data
-        self.metadata = json.load(open("/gfootball/metadata.json", "r"))
+        self.metadata = _load_metadata(METADATA_PATH)
+        # Indexed by obs["ball_owned_team"]: (team metadata, players as a tuple, obs key of its positions)
+        self._teams = (
+            (self.metadata["left_team"], tuple(self.metadata["left_team"]["players"]), "left_team"),
+            (self.metadata["right_team"], tuple(self.metadata["right_team"]["players"]), "right_team"),
+        )
 
         # Match state
         self.total_steps = None
+        self._seconds_per_step = None
         self.match_time = 0.0
+        self._match_time_str = (-1, "")  # (whole seconds, "MM:SS") of the last published event
         self.event_cnt = 0
         self.goal_events = []
         self.card_events = []
 
         # Events metadata
-        self.prev_obs = None
+        # Compact snapshot of the previous step, see _snapshot
+        self.prev_bytes = None
+        self.prev_score = None
+        self.prev_game_mode = None
         self.prev_owned_state = None
+        self._last_fingerprint = None
         self.pass_state = None
         self.shot_state = None
         self.last_possession_time = None
@@ -65,187 +148,200 @@ class EventExtractor:
             self.match_started = True
 
 
-    def set_match_time(self, steps_left: int) -> str:
-        self.match_time = 90 * 60 * (self.total_steps - steps_left) / self.total_steps
-
     def get_location_description(self, location: np.ndarray) -> str:
-        x = (location[0] + FIELD_HALF_LENGTH) / (2 * FIELD_HALF_LENGTH)
-        y = (location[1] + FIELD_HALF_WIDTH) / (2 * FIELD_HALF_WIDTH)
-        if x < 3**-1:
-            x_description = "tercio izquierdo de la cancha"
-        elif 3**-1 <= x < 2 * 3**-1:
-            x_description = "centro de la cancha (de izquierda a derecha)"
-        else:
-            x_description = "tercio derecho de la cancha"
-        if y < 3**-1:
-            y_description = "banda superior"
-        elif 3**-1 <= y < 2 * 3**-1:
-            y_description = "medio de la cancha (de arriba a abajo)"
-        else:
-            y_description = "banda inferior"
-        return f"{x_description}__{y_description}"
-
-    def is_directional(self, action: str) -> bool:
-        return action in set([
-            "action_left",
-            "action_top_left",
-            "action_top",
-            "action_top_right",
-            "action_right",
-            "action_bottom_right",
-            "action_bottom",
-            "action_bottom_left"
-        ])
+        x = min(2, max(0, int((location[0] + FIELD_HALF_LENGTH) * _X_THIRDS)))
+        y = min(2, max(0, int((location[1] + FIELD_HALF_WIDTH) * _Y_THIRDS)))
+        return _LOCATION_TABLE[x][y]
+
+    @staticmethod
+    def get_location_descriptions(locations: np.ndarray) -> List[str]:
+        """Vectorized get_location_description for an (N, 2) array, e.g. when replaying observation logs."""
+        locations = np.asarray(locations)
+        x = np.clip(((locations[:, 0] + FIELD_HALF_LENGTH) * _X_THIRDS).astype(np.intp), 0, 2)
+        y = np.clip(((locations[:, 1] + FIELD_HALF_WIDTH) * _Y_THIRDS).astype(np.intp), 0, 2)
+        return [_LOCATION_TABLE[i][j] for i, j in zip(x.tolist(), y.tolist())]
+
+    @staticmethod
+    def is_directional(action: str) -> bool:
+        return action in _DIRECTIONAL_ACTIONS
     
-    def is_pass(self, action: str) -> bool:
-        return action in set([
-            "short_pass",
-            "long_pass",
-            "high_pass"
-        ])
+    @staticmethod
+    def is_pass(action: str) -> bool:
+        return action in _PASS_ACTIONS
     
-    def is_kick(self, action: str) -> bool:
-        return action == "shot" or self.is_pass(action)
+    @staticmethod
+    def is_kick(action: str) -> bool:
+        return action in _KICK_ACTIONS
     
+    def get_match_time_str(self) -> str:
+        seconds = int(self.match_time)
+        if self._match_time_str[0] != seconds:
+            self._match_time_str = (seconds, f"{seconds // 60:02d}:{seconds % 60:02d}")
+        return self._match_time_str[1]
+
+    def _snapshot(self, flags: dict, score: tuple, game_mode: int) -> None:
+        """Keep only what the next step diffs against instead of the whole observation."""
+        self.prev_bytes = flags
+        self.prev_score = score
+        self.prev_game_mode = game_mode
+
+    def _prev_array(self, obs: dict, key: str) -> np.ndarray:
+        return np.frombuffer(self.prev_bytes[key], dtype=obs[key].dtype)
+
     def publish_event(self, event_data: dict) -> None:
         self.event_cnt += 1
         event = {
             "event_id": self.event_cnt,
-            "match_time": f"{self.match_time//60:02.0f}:{self.match_time % 60:02.0f}",
+            "match_time": self.get_match_time_str(),
         }
         event.update(event_data)
 
-        self.event_sender.send_async(str(self.event_cnt), json.dumps(event, indent=4))
+        # Serialized by the sender's writer thread, not on the simulation loop
+        self.event_sender.send_async(str(self.event_cnt), event)
 
     def process_state(self, obs: dict, left_action: str, right_action: str) -> None:
-        if obs["steps_left"] == 0:
+        # Every field read more than once per step is bound to a local up front
+        steps_left = obs["steps_left"]
+        score = tuple(obs["score"])
+        game_mode = obs["game_mode"]
+        ball_owned_team = obs["ball_owned_team"]
+        ball_owned_player = obs["ball_owned_player"]
+        left_team = self.metadata["left_team"]
+        right_team = self.metadata["right_team"]
+
+        if steps_left == 0:
             self.publish_event({
                 "type": "fin_del_partido",
-                "team_left": self.metadata["left_team"]["name"],
-                "score_left": obs["score"][0],
-                "team_right": self.metadata["right_team"]["name"],
-                "score_right": obs["score"][1],
+                "team_left": left_team["name"],
+                "score_left": score[0],
+                "team_right": right_team["name"],
+                "score_right": score[1],
                 "goal_events": self.goal_events,
                 "card_events": self.card_events
             })
-            sleep(10)
+            self.event_sender.flush(timeout=END_OF_MATCH_FLUSH_TIMEOUT)
             return
         if self.total_steps is None:
-            self.total_steps = obs["steps_left"]
-        self.set_match_time(obs["steps_left"])
+            self.total_steps = steps_left
+            self._seconds_per_step = MATCH_SECONDS / self.total_steps
+        self.match_time = (self.total_steps - steps_left) * self._seconds_per_step
 
         # Capture events based on observations
-        if self.prev_obs is not None and self.prev_obs["score"] != obs["score"]:
-            if obs["score"][0] > self.prev_obs["score"][0]:
-                scoring_team = self.metadata["left_team"]
-            else:
-                scoring_team = self.metadata["right_team"]
-            goal_event = {
-                "type": "gol",
-                "subtype": "gol_en_contra" if self.shot_state is not None and self.shot_state["equipo"] != scoring_team["name"] else "gol",
-                "anotador": self.shot_state["jugador"] if self.shot_state is not None else None,
-                "ubicacion": self.shot_state["ubicacion"] if self.shot_state is not None else None,
-                "equipo_anotador": scoring_team["name"],
-                "team_left": self.metadata["left_team"]["name"],
-                "score_left": obs["score"][0],
-                "team_right": self.metadata["right_team"]["name"],
-                "score_right": obs["score"][1],
-            }
-            self.goal_events.append(goal_event)
-            self.publish_event(goal_event)
-            self.shot_state = None
-            sleep(10)
-        if self.prev_obs is not None and not np.array_equal(obs["left_team_yellow_card"], self.prev_obs["left_team_yellow_card"]):
-            for i, (prev_card, curr_card) in enumerate(zip(self.prev_obs["left_team_yellow_card"], obs["left_team_yellow_card"])):
-                if curr_card and not prev_card:
-                    player = self.metadata["left_team"]["players"][i]
-                    card_event = {
-                        "type": "tarjeta_amarilla",
-                        "jugador": player,
-                        "equipo": self.metadata["left_team"]["name"],
-                    }
-                    self.card_events.append(card_event)
-                    self.publish_event(card_event)
-        if self.prev_obs is not None and not np.array_equal(obs["right_team_yellow_card"], self.prev_obs["right_team_yellow_card"]):
-            for i, (prev_card, curr_card) in enumerate(zip(self.prev_obs["right_team_yellow_card"], obs["right_team_yellow_card"])):
-                if curr_card and not prev_card:
-                    player = self.metadata["right_team"]["players"][i]
-                    card_event = {
-                        "type": "tarjeta_amarilla",
-                        "jugador": player,
-                        "equipo": self.metadata["right_team"]["name"],
-                    }
-                    self.card_events.append(card_event)
-                    self.publish_event(card_event)
-        if self.prev_obs is not None and not np.array_equal(obs["left_team_active"], self.prev_obs["left_team_active"]):
-            for i, (prev_active, curr_active) in enumerate(zip(self.prev_obs["left_team_active"], obs["left_team_active"])):
-                if not curr_active and prev_active:
-                    player = self.metadata["left_team"]["players"][i]
-                    card_event = {
-                        "type": "tarjeta_roja",
-                        "jugador": player,
-                        "equipo": self.metadata["left_team"]["name"],
-                    }
-                    self.card_events.append(card_event)
-                    self.publish_event(card_event)
-        if self.prev_obs is not None and not np.array_equal(obs["right_team_active"], self.prev_obs["right_team_active"]):
-            for i, (prev_active, curr_active) in enumerate(zip(self.prev_obs["right_team_active"], obs["right_team_active"])):
-                if not curr_active and prev_active:
-                    player = self.metadata["right_team"]["players"][i]
-                    card_event = {
-                        "type": "tarjeta_roja",
-                        "jugador": player,
-                        "equipo": self.metadata["right_team"]["name"],
-                    }
-                    self.card_events.append(card_event)
-                    self.publish_event(card_event)
-        if self.prev_obs is not None and obs["game_mode"] not in [GameMode.NORMAL, GameMode.KICKOFF] and obs["game_mode"] != self.prev_obs["game_mode"]:
-            game_mode_event = {
-                "type": "pelota_parada",
-                "subtype": gameModeMap[obs["game_mode"]],
-            }
-            self.publish_event(game_mode_event)
+        # Comparing raw bytes is a memcmp; only a changed array gets scanned player by player
+        flags = {key: obs[key].tobytes() for key in _FLAG_KEYS}
+
+        # Most steps change nothing an event depends on: same score, mode, flags and ball owner, no kick,
+        # and no possession timeout due. Those skip every diff and the possession bookkeeping below
+        fingerprint = (score, game_mode, ball_owned_team, ball_owned_player, flags)
+        if (fingerprint == self._last_fingerprint
+                and left_action not in _KICK_ACTIONS and right_action not in _KICK_ACTIONS
+                and (self.last_possession_time is None
+                     or perf_counter() - self.last_possession_time <= self.possession_timeout)):
+            return
+        self._last_fingerprint = fingerprint
+
+        prev_bytes = self.prev_bytes
+        if prev_bytes is not None:
+            if score != self.prev_score:
+                if score[0] > self.prev_score[0]:
+                    scoring_team = left_team
+                else:
+                    scoring_team = right_team
+                goal_event = {
+                    "type": "gol",
+                    "subtype": "gol_en_contra" if self.shot_state is not None and self.shot_state.equipo != scoring_team["name"] else "gol",
+                    "anotador": self.shot_state.jugador if self.shot_state is not None else None,
+                    "ubicacion": self.shot_state.ubicacion if self.shot_state is not None else None,
+                    "equipo_anotador": scoring_team["name"],
+                    "team_left": left_team["name"],
+                    "score_left": score[0],
+                    "team_right": right_team["name"],
+                    "score_right": score[1],
+                }
+                self.goal_events.append(goal_event)
+                self.publish_event(goal_event)
+                self.shot_state = None
+            # One dict compare settles the common step where no card or active flag moved
+            if flags != prev_bytes:
+                if flags["left_team_yellow_card"] != prev_bytes["left_team_yellow_card"]:
+                    for i in _new_flags(obs["left_team_yellow_card"], self._prev_array(obs, "left_team_yellow_card")):
+                        card_event = {
+                            "type": "tarjeta_amarilla",
+                            "jugador": left_team["players"][i],
+                            "equipo": left_team["name"],
+                        }
+                        self.card_events.append(card_event)
+                        self.publish_event(card_event)
+                if flags["right_team_yellow_card"] != prev_bytes["right_team_yellow_card"]:
+                    for i in _new_flags(obs["right_team_yellow_card"], self._prev_array(obs, "right_team_yellow_card")):
+                        card_event = {
+                            "type": "tarjeta_amarilla",
+                            "jugador": right_team["players"][i],
+                            "equipo": right_team["name"],
+                        }
+                        self.card_events.append(card_event)
+                        self.publish_event(card_event)
+                # A sent-off player goes from active to inactive
+                if flags["left_team_active"] != prev_bytes["left_team_active"]:
+                    for i in _new_flags(self._prev_array(obs, "left_team_active"), obs["left_team_active"]):
+                        card_event = {
+                            "type": "tarjeta_roja",
+                            "jugador": left_team["players"][i],
+                            "equipo": left_team["name"],
+                        }
+                        self.card_events.append(card_event)
+                        self.publish_event(card_event)
+                if flags["right_team_active"] != prev_bytes["right_team_active"]:
+                    for i in _new_flags(self._prev_array(obs, "right_team_active"), obs["right_team_active"]):
+                        card_event = {
+                            "type": "tarjeta_roja",
+                            "jugador": right_team["players"][i],
+                            "equipo": right_team["name"],
+                        }
+                        self.card_events.append(card_event)
+                        self.publish_event(card_event)
+            if game_mode not in _EXCLUDED_MODES and game_mode != self.prev_game_mode:
+                game_mode_event = {
+                    "type": "pelota_parada",
+                    "subtype": gameModeMap[game_mode],
+                }
+                self.publish_event(game_mode_event)
 
         # Capture events based on actions
-        if obs["ball_owned_team"] == -1:
-            self.prev_obs = obs
+        if ball_owned_team == -1:
+            self._snapshot(flags, score, game_mode)
             return            
 
         # Init variables
-        if obs["ball_owned_team"] == 0:
-            attacking_team = self.metadata["left_team"]
-            attacking_obs = obs["left_team"]
-            attacking_action = left_action
-        else:
-            attacking_team = self.metadata["right_team"]
-            attacking_obs = obs["right_team"]
-            attacking_action = right_action
-        attacking_player = attacking_team["players"][obs["ball_owned_player"]]
-        attacking_player_location = self.get_location_description(attacking_obs[obs["ball_owned_player"]])
+        attacking_team, attacking_players, team_key = self._teams[ball_owned_team]
+        attacking_action = left_action if ball_owned_team == 0 else right_action
+        attacking_player = attacking_players[ball_owned_player]
+        attacking_player_location = self.get_location_description(obs[team_key][ball_owned_player])
 
         # Capture the second action of two-step events
-        if self.pass_state is not None and self.pass_state["jugador"] != attacking_player:
+        # Player dicts all come from self.metadata, so identity is equality without walking the dicts
+        if self.pass_state is not None and self.pass_state.jugador is not attacking_player:
             self.publish_event({
-                "type": self.pass_state["type"],
-                "subtype": self.pass_state["subtype"],
-                "intervalo_segundos": int(self.match_time - self.pass_state["match_time"]),
-                "equipo": self.pass_state["equipo"],
-                "pasador": self.pass_state["jugador"],
-                "ubicacion_pase": self.pass_state["ubicacion"],
+                "type": "pase",
+                "subtype": self.pass_state.subtype,
+                "intervalo_segundos": int(self.match_time - self.pass_state.match_time),
+                "equipo": self.pass_state.equipo,
+                "pasador": self.pass_state.jugador,
+                "ubicacion_pase": self.pass_state.ubicacion,
                 "receptor": attacking_player,
                 "ubicacion_recepcion": attacking_player_location,
-                "pase_completado": self.pass_state["equipo"] == attacking_team["name"],
+                "pase_completado": self.pass_state.equipo == attacking_team["name"],
             })
             self.pass_state = None
         elif self.prev_owned_state is not None:
-            if self.prev_owned_state["jugador"] != attacking_player:
+            if self.prev_owned_state.jugador is not attacking_player:
                 self.publish_event({
                     "type": "quite_de_posesion",
-                    "subtype": "mismo_equipo" if self.prev_owned_state["equipo"] == attacking_team["name"] else "equipo_diferente",
+                    "subtype": "mismo_equipo" if self.prev_owned_state.equipo == attacking_team["name"] else "equipo_diferente",
                     "equipo_actual": attacking_team["name"],
-                    "equipo_anterior": self.prev_owned_state["equipo"],
+                    "equipo_anterior": self.prev_owned_state.equipo,
                     "jugador_actual": attacking_player,
-                    "jugador_anterior": self.prev_owned_state["jugador"],
+                    "jugador_anterior": self.prev_owned_state.jugador,
                     "ubicacion": attacking_player_location,
                 })
                 self.last_possession_time = perf_counter()
@@ -257,39 +353,25 @@ class EventExtractor:
                     "ubicacion": attacking_player_location,
                 })
                 self.last_possession_time = perf_counter()
-        if self.shot_state is not None and self.shot_state["jugador"] != attacking_player:
+        if self.shot_state is not None and self.shot_state.jugador is not attacking_player:
+            saved = attacking_player["short_position"] == GOALKEEPER_POSITION
             self.publish_event({
                 "type": "disparo",
-                "subtype": "atajado" if attacking_player["short_position"] == "GK" else "fallado",
-                "equipo": self.shot_state["equipo"],
-                "jugador": self.shot_state["jugador"],
-                "portero": attacking_player if attacking_player["short_position"] == "GK" else None,
-                "ubicacion": self.shot_state["ubicacion"],
-                "intervalo_segundos": int(self.match_time - self.shot_state["match_time"]),
+                "subtype": "atajado" if saved else "fallado",
+                "equipo": self.shot_state.equipo,
+                "jugador": self.shot_state.jugador,
+                "portero": attacking_player if saved else None,
+                "ubicacion": self.shot_state.ubicacion,
+                "intervalo_segundos": int(self.match_time - self.shot_state.match_time),
             })
             self.shot_state = None
         
         # Capture the first action of two-step events
-        if self.is_pass(attacking_action):
-            self.pass_state = {
-                "type": "pase",
-                "subtype": attacking_action,
-                "match_time": self.match_time,
-                "equipo": attacking_team["name"],
-                "jugador": attacking_player,
-                "ubicacion": attacking_player_location,
-            }
+        if attacking_action in _PASS_ACTIONS:
+            self.pass_state = _PlayState(attacking_team["name"], attacking_player, attacking_player_location,
+                                         self.match_time, attacking_action)
         elif attacking_action == "shot":
-            self.shot_state = {
-                "type": "disparo",
-                "match_time": self.match_time,
-                "equipo": attacking_team["name"],
-                "jugador": attacking_player,
-                "ubicacion": attacking_player_location,
-            }
-        self.prev_obs = obs
-        self.prev_owned_state = {
-            "equipo": attacking_team["name"],
-            "jugador": attacking_player,
-            "ubicacion": attacking_player_location,
-        }
+            self.shot_state = _PlayState(attacking_team["name"], attacking_player, attacking_player_location,
+                                         self.match_time)
+        self._snapshot(flags, score, game_mode)
+        self.prev_owned_state = _PlayState(attacking_team["name"], attacking_player, attacking_player_location)
@@ -13,11 +13,17 @@ class FootballCommentatorEnv(FootballEnv):
                 len(action))
 
         actions = self._get_actions()
-        _, reward, done, info = self._env.step(actions)
+        raw_observation, reward, done, info = self._env.step(actions)
         score_reward = reward
         if self._agent:
             reward = ([reward] * self._agent.num_controlled_left_players() +
                       [-reward] * self._agent.num_controlled_right_players())
-        self._cached_observation = None
+            self._cached_observation = self._convert_observations(
+                raw_observation, self._agent,
+                self._agent_left_position, self._agent_right_position)
+        else:
+            # The core rebuilds this dict on every step, so it can be handed out
+            # as-is instead of deep-copied again by self._env.observation()
+            self._cached_observation = raw_observation
         info['score_reward'] = score_reward
         return self.observation(), actions, done
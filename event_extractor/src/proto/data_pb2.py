@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\ndata.proto\x12\x08pipeline\"!\n\x05\x45vent\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x02 \x01(\t\"#\n\x07\x43omment\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0c\n\x04text\x18\x02 \x01(\t\"\'\n\x05\x41udio\x12\n\n\x02id\x18\x01 \x01(\t\x12\x12\n\naudio_data\x18\x02 \x01(\x0c\"=\n\rBasicResponse\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0f\n\x07success\x18\x02 \x01(\x08\x12\x0f\n\x07message\x18\x03 \x01(\t2C\n\x07ModuleB\x12\x38\n\x0cProcessEvent\x12\x0f.pipeline.Event\x1a\x17.pipeline.BasicResponse2E\n\x07ModuleC\x12:\n\x0cTextToSpeech\x12\x11.pipeline.Comment\x1a\x17.pipeline.BasicResponse2@\n\x07ModuleD\x12\x35\n\tPlayAudio\x12\x0f.pipeline.Audio\x1a\x17.pipeline.BasicResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\ndata.proto\x12\x08pipeline\"!\n\x05\x45vent\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x02 \x01(\t\"#\n\x07\x43omment\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0c\n\x04text\x18\x02 \x01(\t\"\'\n\x05\x41udio\x12\n\n\x02id\x18\x01 \x01(\t\x12\x12\n\naudio_data\x18\x02 \x01(\x0c\"=\n\rBasicResponse\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0f\n\x07success\x18\x02 \x01(\x08\x12\x0f\n\x07message\x18\x03 \x01(\t2\x82\x01\n\x07ModuleB\x12\x38\n\x0cProcessEvent\x12\x0f.pipeline.Event\x1a\x17.pipeline.BasicResponse\x12=\n\rProcessEvents\x12\x0f.pipeline.Event\x1a\x17.pipeline.BasicResponse(\x01\x30\x01\x32\x81\x01\n\x07ModuleC\x12:\n\x0cTextToSpeech\x12\x11.pipeline.Comment\x1a\x17.pipeline.BasicResponse\x12:\n\nStreamText\x12\x11.pipeline.Comment\x1a\x17.pipeline.BasicResponse(\x01\x32@\n\x07ModuleD\x12\x35\n\tPlayAudio\x12\x0f.pipeline.Audio\x1a\x17.pipeline.BasicResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -39,10 +39,10 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_AUDIO']._serialized_end=135
   _globals['_BASICRESPONSE']._serialized_start=137
   _globals['_BASICRESPONSE']._serialized_end=198
-  _globals['_MODULEB']._serialized_start=200
-  _globals['_MODULEB']._serialized_end=267
-  _globals['_MODULEC']._serialized_start=269
-  _globals['_MODULEC']._serialized_end=338
-  _globals['_MODULED']._serialized_start=340
-  _globals['_MODULED']._serialized_end=404
+  _globals['_MODULEB']._serialized_start=201
+  _globals['_MODULEB']._serialized_end=331
+  _globals['_MODULEC']._serialized_start=334
+  _globals['_MODULEC']._serialized_end=463
+  _globals['_MODULED']._serialized_start=465
+  _globals['_MODULED']._serialized_end=529
 # @@protoc_insertion_point(module_scope)
@@ -40,6 +40,11 @@ class ModuleBStub(object):
                 request_serializer=data__pb2.Event.SerializeToString,
                 response_deserializer=data__pb2.BasicResponse.FromString,
                 _registered_method=True)
+        self.ProcessEvents = channel.stream_stream(
+                '/pipeline.ModuleB/ProcessEvents',
+                request_serializer=data__pb2.Event.SerializeToString,
+                response_deserializer=data__pb2.BasicResponse.FromString,
+                _registered_method=True)
 
 
 class ModuleBServicer(object):
@@ -52,6 +57,13 @@ class ModuleBServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ProcessEvents(self, request_iterator, context):
+        """Long-lived stream used by Module A: one response per event, in order
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_ModuleBServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -60,6 +72,11 @@ def add_ModuleBServicer_to_server(servicer, server):
                     request_deserializer=data__pb2.Event.FromString,
                     response_serializer=data__pb2.BasicResponse.SerializeToString,
             ),
+            'ProcessEvents': grpc.stream_stream_rpc_method_handler(
+                    servicer.ProcessEvents,
+                    request_deserializer=data__pb2.Event.FromString,
+                    response_serializer=data__pb2.BasicResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'pipeline.ModuleB', rpc_method_handlers)
@@ -99,6 +116,33 @@ class ModuleB(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def ProcessEvents(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/pipeline.ModuleB/ProcessEvents',
+            data__pb2.Event.SerializeToString,
+            data__pb2.BasicResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
 
 class ModuleCStub(object):
     """Service run by Module C
@@ -115,6 +159,11 @@ class ModuleCStub(object):
                 request_serializer=data__pb2.Comment.SerializeToString,
                 response_deserializer=data__pb2.BasicResponse.FromString,
                 _registered_method=True)
+        self.StreamText = channel.stream_unary(
+                '/pipeline.ModuleC/StreamText',
+                request_serializer=data__pb2.Comment.SerializeToString,
+                response_deserializer=data__pb2.BasicResponse.FromString,
+                _registered_method=True)
 
 
 class ModuleCServicer(object):
@@ -127,6 +176,13 @@ class ModuleCServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamText(self, request_iterator, context):
+        """Commentary pushed by Module B fragment by fragment while the LLM is still writing it
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_ModuleCServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -135,6 +191,11 @@ def add_ModuleCServicer_to_server(servicer, server):
                     request_deserializer=data__pb2.Comment.FromString,
                     response_serializer=data__pb2.BasicResponse.SerializeToString,
             ),
+            'StreamText': grpc.stream_unary_rpc_method_handler(
+                    servicer.StreamText,
+                    request_deserializer=data__pb2.Comment.FromString,
+                    response_serializer=data__pb2.BasicResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'pipeline.ModuleC', rpc_method_handlers)
@@ -174,6 +235,33 @@ class ModuleC(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def StreamText(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            '/pipeline.ModuleC/StreamText',
+            data__pb2.Comment.SerializeToString,
+            data__pb2.BasicResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
 
 class ModuleDStub(object):
     """Service run by Module D
@@ -1,48 +1,125 @@
 import logging
-from functools import partial
-from typing import Dict, Optional
+import queue
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterator, Optional, Tuple, Union
 import grpc
-from utils.discovery_utils import get_env_var, get_service_endpoint_from_discovery
+import orjson
+from utils.discovery_utils import get_env_var, get_service_endpoint_from_discovery, GRPC_CHANNEL_OPTIONS
 from proto import data_pb2, data_pb2_grpc
 
-logging.basicConfig(level=logging.INFO, format="[Module A] %(asctime)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S,%f"[:-3])
+logging.basicConfig(level=logging.INFO, format="[Module A] %(asctime)s.%(msecs)03d - %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
 logger = logging.getLogger(__name__)
 MODULE_B_HOST = get_env_var("MODULE_B_HOST") or get_service_endpoint_from_discovery("module_b")
 
+RECONNECT_DELAY = 1.0  # seconds between attempts to reopen the event stream
+# Compact JSON by default (numpy scalars from obs serialize natively); DEBUG_PRETTY indents it for local reading
+EVENT_JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | (orjson.OPT_INDENT_2 if get_env_var("DEBUG_PRETTY") else 0)
+
+
+@lru_cache(maxsize=8)
+def _channel_for(host: str) -> grpc.Channel:
+    """One long-lived keepalive channel per host, shared by every EventSender."""
+    return grpc.insecure_channel(host, options=GRPC_CHANNEL_OPTIONS)
+
+
 class EventSender:
-    """Client wrapper responsible for sending events to Module B asynchronously."""
+    """Client wrapper responsible for sending events to Module B asynchronously.
+
+    Events are queued and written by a background thread into a single
+    ``ProcessEvents`` stream, so they share one HTTP/2 stream instead of
+    paying a unary call each. Dict payloads are serialized on that thread
+    too, keeping the JSON encoding off the caller's loop.
+    """
 
     def __init__(self):
 
         self.host = MODULE_B_HOST
-        self._channel = grpc.insecure_channel(self.host)
+        self._channel = _channel_for(self.host)
         self._stub = data_pb2_grpc.ModuleBStub(self._channel)
 
+        self._queue: "queue.Queue[Optional[Tuple[str, Union[str, dict]]]]" = queue.Queue()
+        self._closed = False
+        self._pending = None  # event taken off the queue after its stream died; the next stream sends it first
+        self._unacked = 0  # events handed to the stream without a response yet
+        self._idle = threading.Condition()
+        self._writer_thread = threading.Thread(target=self._writer, name="event-sender", daemon=True)
+        self._writer_thread.start()
+
     # ------------------------------------------------------------------
     # public API
     # ------------------------------------------------------------------
-    def send_async(self, event_id: str, payload: str) -> None:
-        """Fire-and-forget send; returns immediately."""
-        event_msg = data_pb2.Event(id=event_id, data=payload)
-        future = self._stub.ProcessEvent.future(event_msg)
-        future.add_done_callback(partial(self._on_response, event_id=event_id))
+    def send_async(self, event_id: str, payload: Union[str, dict]) -> None:
+        """Fire-and-forget send; returns immediately. A dict payload is JSON-encoded by the writer thread."""
+        with self._idle:
+            self._unacked += 1
+            self._queue.put((event_id, payload))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every queued event has been answered; False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._unacked == 0, timeout=timeout)
 
     def close(self) -> None:
-        self._channel.close()
+        """Finish the event stream; the channel itself is shared and stays open."""
+        self._closed = True
+        self._queue.put(None)
 
     # ------------------------------------------------------------------
     # internal helpers
     # ------------------------------------------------------------------
-    @staticmethod
-    def _on_response(future: grpc.Future, event_id: str):
-        try:
-            response = future.result()
-            status_icon = "✅" if response.success else "❌"
-            logger.info(
-                "%s Async response (id=%s): msg='%s'",
-                status_icon,
-                response.id,
-                response.message,
-            )
-        except grpc.RpcError as exc:
-            logger.error("❌ Async call for id=%s failed: %s", event_id, exc)
+    def _writer(self) -> None:
+        """Keep one ProcessEvents stream open, reopening it if Module B drops it."""
+        while not self._closed:
+            call_done = threading.Event()
+            try:
+                # wait_for_ready holds the stream (and any events it has taken) until Module B is reachable
+                responses = self._stub.ProcessEvents(self._requests(call_done), wait_for_ready=True)
+                for response in responses:
+                    self._on_response(response)
+            except grpc.RpcError as exc:
+                logger.error("❌ Event stream to %s failed: %s", self.host, exc)
+            finally:
+                call_done.set()
+            if not self._closed:
+                # Sleep first so the dead stream's iterator has stowed any event it was holding
+                time.sleep(RECONNECT_DELAY)
+                # Whatever the dead stream took but never answered is lost
+                with self._idle:
+                    self._unacked = self._queue.qsize() + (self._pending is not None)
+                    self._idle.notify_all()
+
+    def _requests(self, call_done: threading.Event) -> Iterator[data_pb2.Event]:
+        """Yield queued events into the current stream until it ends or the sender closes."""
+        while not call_done.is_set():
+            if self._pending is not None:
+                event, self._pending = self._pending, None
+            else:
+                try:
+                    event = self._queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+            if event is None:
+                return
+            if call_done.is_set():
+                # The stream died while we were waiting; keep the event at the head for the next one
+                self._pending = event
+                return
+            event_id, payload = event
+            if not isinstance(payload, str):
+                payload = orjson.dumps(payload, option=EVENT_JSON_OPTIONS).decode()
+            yield data_pb2.Event(id=event_id, data=payload)
+
+    def _on_response(self, response: data_pb2.BasicResponse) -> None:
+        status_icon = "✅" if response.success else "❌"
+        logger.info(
+            "%s Async response (id=%s): msg='%s'",
+            status_icon,
+            response.id,
+            response.message,
+        )
+        with self._idle:
+            self._unacked = max(self._unacked - 1, 0)
+            if self._unacked == 0:
+                self._idle.notify_all()
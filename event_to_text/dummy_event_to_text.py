@@ -1,6 +1,6 @@
+import asyncio
 import logging
 import random
-import time
 from proto import data_pb2  # type: ignore
 
 logger = logging.getLogger(__name__)
@@ -15,16 +15,34 @@ class EventToText:
     def __init__(self, min_delay: float = 0.5, max_delay: float = 2.0):
         self.min_delay = min_delay
         self.max_delay = max_delay
+        self._inbox = asyncio.Queue()
 
-    def process(self, event: data_pb2.Event) -> str:
+    async def process(self, event: data_pb2.Event) -> str:
         """Process incoming Event and return text string."""
         delay = random.uniform(self.min_delay, self.max_delay)
         logger.info(f"🛠️  Processing Event (id={event.id}) for {delay:.2f}s…")
-        time.sleep(delay)
+        await asyncio.sleep(delay)
         # Simple conversion: join map key/values
         text = ", ".join(f"La clave {k} tiene {v}" for k, v in event.data.items())
         logger.info(f"✅ Processed Event (id={event.id}) text:\n'{text[:90]}…'")
         return text 
     
+    async def submit(self, event: data_pb2.Event) -> None:
+        await self._inbox.put(event)
+
+    async def worker(self, sink) -> None:
+        """Process queued events one by one, passing each text to sink as a single fragment."""
+        while True:
+            event = await self._inbox.get()
+            text = await self.process(event)
+            await sink(event.id, self._single_fragment(text))
+
+    @staticmethod
+    async def _single_fragment(text: str):
+        yield text
+
+    async def close(self) -> None:
+        pass
+
     def process_start_of_match(self, event: data_pb2.Event) -> str:
         return str(event.data)
\ No newline at end of file
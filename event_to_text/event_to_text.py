@@ -1,18 +1,57 @@
+import asyncio
 import os
+import threading
 import time
 import logging
-import json
+import orjson
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from openai import AzureOpenAI
+from openai import AsyncAzureOpenAI
 from proto import data_pb2
-from typing import List
-from openai import OpenAI
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+from openai import AsyncOpenAI, RateLimitError
 import re
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import cycle, groupby
+
+import httpx
+import tiktoken
 
 
 logger = logging.getLogger(__name__)
 
+# Receives a commentary as it is generated: (id of the triggering event, text fragments)
+CommentarySink = Callable[[str, AsyncIterator[str]], Awaitable[None]]
+
+SENTENCE_ENDINGS = (".", "!", "?")  # a streamed fragment is sent to TTS once it ends with one of these
+
+# Event types that trigger a commentary right away, most important first
+COMMENTARY_TRIGGERS = ("inicio_del_partido", "fin_del_partido", "gol", "disparo", "pelota_parada", "pase")
+TRIGGER_PRIORITY = {event_type: rank for rank, event_type in enumerate(COMMENTARY_TRIGGERS)}
+
+# When the queue is full, the oldest event of the first type listed here is dropped
+EVICTION_ORDER = ("pase", "mantenimiento_de_posesion", "quite_de_posesion", "pelota_parada",
+                  "tarjeta_amarilla", "disparo", "tarjeta_roja")
+
+# Event compaction before prompting
+UNCOMPACTED_TYPES = frozenset({"gol", "inicio_del_partido", "fin_del_partido"})  # always sent in full
+SUPERSEDED_BY = {"gol": ("disparo",)}  # a goal already tells the story of the shots before it
+PLAYER_FIELDS = ("jugador", "pasador", "jugador_actual")  # who "owns" an event, by type
+
+DEFAULT_PREFIX_RE = re.compile(r"^default\s*\n+")  # stripped from dataset inputs
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """tiktoken encoding for model, loaded once per process."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Azure deployment names are arbitrary, fall back to the GPT-4 family encoding
+        return tiktoken.get_encoding("cl100k_base")
+
 
 class EventToText:
     """NLP processing: converts batches of events to game commentary"""
@@ -21,13 +60,18 @@ class EventToText:
                  api_key: str = None,
                  endpoint: str = None,
                  deployment: str = None,
+                 deployments: List[str] = None,
                  max_tokens: int = 50,  # Increased for batch processing
                  temperature: float = 0.7,
                  top_p: float = 0.9):
         # Load configuration from env if not provided
         self.api_key = api_key or os.getenv("API_KEY")
         self.endpoint = endpoint or os.getenv("ENDPOINT")
-        self.deployment = deployment or os.getenv("DEPLOYMENT")
+        # DEPLOYMENT may list several comma-separated deployments to spread the rate limits over
+        self.deployments = deployments or [
+            name.strip() for name in (deployment or os.getenv("DEPLOYMENT") or "").split(",") if name.strip()
+        ]
+        self.deployment = self.deployments[0] if self.deployments else None
         self.max_tokens = max_tokens
         self.temperature = temperature
         self.top_p = top_p
@@ -35,33 +79,81 @@ class EventToText:
         if not all([self.api_key, self.endpoint, self.deployment]):
             raise ValueError("Azure OpenAI API key, endpoint, and deployment must be set")
 
+        # Requests go round-robin over the deployments; a rate-limited one fails over to the next
+        self._next_deployment = cycle(self.deployments).__next__
+        self.rate_limit_backoff = 0.5  # seconds, doubled on every full pass over rate-limited deployments
+        self.max_rate_limit_passes = 3
+
+        # One pooled HTTP/2 client for every LLM call, so concurrent requests share a TLS session
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+            http2=True,
+            timeout=httpx.Timeout(30.0, connect=5.0),
+        )
+
         # If the endpoint contains localhost, use OpenAI client
         if "localhost" in self.endpoint:
             logger.info("Using OpenAI client for local development")
-            self.client = OpenAI(
+            self.client = AsyncOpenAI(
                 api_key=self.api_key,
                 base_url=self.endpoint,
+                http_client=self._http,
+                # With several deployments a 429 is retried on the next one instead of the same one
+                max_retries=0 if len(self.deployments) > 1 else 2,
             )
         else:
             logger.info("Using Azure OpenAI client")
-            self.client = AzureOpenAI(
+            self.client = AsyncAzureOpenAI(
                 api_key=self.api_key,
                 azure_endpoint=self.endpoint,
-                api_version="2024-12-01-preview"
+                api_version="2024-12-01-preview",
+                http_client=self._http,
+                # With several deployments a 429 is retried on the next one instead of the same one
+                max_retries=0 if len(self.deployments) > 1 else 2,
             )
 
-        # Conversation history - keep last 5 exchanges (10 messages)
-        self.conversation_history = []
-        self.max_history_exchanges = 5
+        # Conversation history - keep as many recent exchanges as fit in the token budget
+        self.conversation_history = deque()
+        self._history_token_counts = deque()  # token count of each history message, same order
+        self._history_tokens = 0
+        self.max_history_tokens = 1500
+        self._encoder = get_encoding(self.deployment)
+
+        # Exchanges trimmed from the history are condensed into a running summary in the background
+        self.history_summary = ""
+        self.summary_max_tokens = 150
+        self._condense_lock = asyncio.Lock()
+        self._condense_tasks = set()
 
-        # Debug logging setup
+        # Debug logging setup: one file per LLM call, only at DEBUG level and for 1 in N calls
         self.debug_dir = Path("debug_llm_calls")
-        self.debug_dir.mkdir(exist_ok=True)
         self.call_counter = 0
+        self._debug_sample_rate = max(int(os.getenv("DEBUG_SAMPLE_RATE", "1")), 1)
+        # Debug and dataset files are written by a single background thread, in call order
+        self._io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="module-b-io")
+
+        # Dataset entries are buffered and appended to disk in batches
+        self.dataset_path = Path("dataset.jsonl")
+        self.dataset_flush_interval = 2.0  # seconds
+        self.dataset_flush_size = 32  # entries
+        self._dataset_buffer: List[bytes] = []
+        self._dataset_lock = threading.Lock()
+        self._dataset_flush_task: Optional[asyncio.Task] = None
 
         self.max_commentary_interval = 10.0
         self.last_commentary_time = 0.0
-        self.events_queue = []
+        self.events_queue: List[Tuple[dict, str]] = []  # (parsed event, its JSON as received)
+        self.max_queued_events = 64  # bounds the prompt a slow or failed LLM call leaves behind
+        self.coalesce_window = 0.2  # seconds a trigger waits for more triggers to share its LLM call
+
+        # Routine events narrated locally (template, player field) while the LLM spoke recently
+        self._local_templates = {
+            "pase": ("La tiene {player}.", "receptor"),
+        }
+        self.local_commentary_window = 5.0  # seconds since the last LLM commentary
+        self.max_fragment_words = 8  # flush a streamed fragment that runs this long without a sentence end
+        # gRPC handlers only drop events here; worker() owns all of the state above
+        self._inbox: "asyncio.Queue[data_pb2.Event]" = asyncio.Queue(maxsize=256)
 
         self.max_words = {
             "default": 3, 
@@ -71,6 +163,21 @@ class EventToText:
             "disparo": 5,
         }
 
+        # Only the word budget and the events change between calls
+        self._user_prompt_template = (
+            "Instrucciones para el prompt que tenés que generar:\n\n"
+            "Genera un relato resaltando los eventos más importantes en un comentario de "
+            "relator de fútbol profesional argentino. Es muy importante que el "
+            "relato sea fluido, emocionante y fácil de seguir para los oyentes en tiempo real."
+            "El relato debe ser de no más de {n_words} palabras ({n_seconds} segundos), "
+            "y no debe repetir eventos anteriores. "
+            "Es muy importante que respetes la restricción del número de palabras ya que "
+            "el relato será convertido a voz por un sintetizador de voz profesional (TTS) "
+            "en tiempo real y atrasarse implicaría que se arruine la experiencia de los oyentes. "
+            "Si no lo respetás, serás castigado con la pena de muerte y no podrás relatar más partidos. "
+            "Secuencia de {n_events} eventos del juego:\n\n{events_text}\n\n"
+        )
+
         # System prompts
         time_interval = 1.0  # seconds
         self.system_prompts = {
@@ -120,94 +227,324 @@ class EventToText:
                 "Tu texto relatado luego será convertido a voz por un sintetizador de voz profesional (TTS). "
             )
         }
-
-    def get_user_prompt(self, events: List[dict], n_words: int):
-        events = [json.dumps(event, indent=4, ensure_ascii=False) for event in events]
-        events_text = "\n\n---\n\n".join(events)
-        return (
-            "Instrucciones para el prompt que tenés que generar:\n\n"
-            "Genera un relato resaltando los eventos más importantes en un comentario de "
-            "relator de fútbol profesional argentino. Es muy importante que el "
-            "relato sea fluido, emocionante y fácil de seguir para los oyentes en tiempo real."
-            f"El relato debe ser de no más de {n_words} palabras ({n_words*2} segundos), "
-            "y no debe repetir eventos anteriores. "
-            "Es muy importante que respetes la restricción del número de palabras ya que "
-            "el relato será convertido a voz por un sintetizador de voz profesional (TTS) "
-            "en tiempo real y atrasarse implicaría que se arruine la experiencia de los oyentes. "
-            "Si no lo respetás, serás castigado con la pena de muerte y no podrás relatar más partidos. "
-            f"Secuencia de {len(events)} eventos del juego:\n\n{events_text}\n\n"
-
-
-
-
-
+        # Byte-identical system message per event type, so each request shares its prefix
+        # with the previous ones (and hits the provider's prompt cache)
+        self._system_headers = {
+            event_type: [{"role": "system", "content": prompt}]
+            for event_type, prompt in self.system_prompts.items()
+        }
+        for event_type, prompt in self.system_prompts.items():
+            logger.info("System prompt %s: %d tokens", event_type, len(self._encoder.encode(prompt)))
+
+    async def close(self):
+        """Release the HTTP connection pool and let pending file writes finish."""
+        await self.client.close()
+        if self._dataset_flush_task is not None:
+            self._dataset_flush_task.cancel()
+        # Queued behind any pending gen_dataset calls, so their entries are written too
+        self._write_in_background(self._flush_dataset)
+        await asyncio.to_thread(self._io_executor.shutdown)
+
+    def get_user_prompt(self, events: List[str], n_words: int):
+        # events are already-serialized JSON objects, so the array is just joined, never re-dumped
+        return self._user_prompt_template.format(
+            n_words=n_words,
+            n_seconds=n_words * 2,
+            n_events=len(events),
+            events_text=f"[{','.join(events)}]",
         )
 
-    def generate_commentary(self, event_type: str) -> str:
-        user_msg = self.get_user_prompt(self.events_queue, self.max_words.get(event_type, self.max_words["default"]))
+    async def generate_commentary(self, event_type: str) -> str:
+        fragments = [fragment async for fragment in self.stream_commentary(event_type)]
+        return " ".join(fragments)
+
+    async def stream_commentary(self, event_type: str) -> AsyncIterator[str]:
+        """Yield the commentary in speakable fragments while the LLM is still writing it."""
+        events = self.events_queue
+        if not events:
+            return
+        self.events_queue = []
+        self.last_commentary_time = time.time()
+        user_msg = self.get_user_prompt(self._compact_events(events), self.max_words.get(event_type, self.max_words["default"]))
+        messages = self._build_messages(event_type, user_msg)
 
         # Call Azure OpenAI with conversation history
         start = time.time()
+        first_fragment_latency = None
+        parts = []
+        buffer = ""
+        usage = None
         try:
-            messages = self._build_messages(self.system_prompts.get(event_type, self.system_prompts["default"]), user_msg)
-            response = self.client.chat.completions.create(
-                model=self.deployment,
+            stream = await self._create_completion(
                 messages=messages,
                 max_tokens=self.max_tokens,
                 temperature=self.temperature,
                 top_p=self.top_p,
+                stream=True,
+                stream_options={"include_usage": True},
             )
-            latency = time.time() - start
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                # Azure sends a content-filter chunk without choices first
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                delta = chunk.choices[0].delta.content
+                parts.append(delta)
+                buffer += delta
+
+                fragment, buffer = self._split_fragment(buffer)
+                if fragment:
+                    if first_fragment_latency is None:
+                        first_fragment_latency = time.time() - start
+                    yield fragment
 
-            # Extract comment
-            comment = response.choices[0].message.content.strip()
+        except Exception as e:
+            logger.error(f"Error processing batch of {len(events)} events: {str(e)}")
+            return
 
-            # Add to conversation history
-            self._add_to_conversation(user_msg, comment)
+        if buffer.strip():
+            if first_fragment_latency is None:
+                first_fragment_latency = time.time() - start
+            yield buffer.strip()
+        latency = time.time() - start
 
-            # Save debug information
-            self._save_debug_call(f"", messages, comment, latency)
+        # Extract comment
+        comment = "".join(parts).strip()
+        if not comment:
+            return
 
-            # Generate dataset entry
-            dataset = self.gen_dataset(
-                messages,
-                comment,
-                json_path="dataset.json"
-            )
+        # Add to conversation history
+        self._add_to_conversation(user_msg, comment)
 
-            # Log metrics
-            logger.info(
-                "[Module B] Processed batch of %d events in %.2f s (tokens: %s)",
-                len(self.events_queue),
-                latency,
-                getattr(response.usage, 'total_tokens', None)
-            )
-            # Log prompt
-            logger.info(f'  Comment:\n{comment}')
-
-            self.events_queue.clear()
-            self.last_commentary_time = time.time()
-            return comment
+        # Save debug information and the dataset entry without holding up the response
+        self.call_counter += 1
+        if logger.isEnabledFor(logging.DEBUG) and self.call_counter % self._debug_sample_rate == 0:
+            self._write_in_background(self._save_debug_call, self.call_counter, f"", messages,
+                                      [event for event, raw in events], comment, latency)
+        self._write_in_background(self.gen_dataset, messages, comment)
+        if self._dataset_flush_task is None:
+            self._dataset_flush_task = asyncio.create_task(self._dataset_flush_loop())
+
+        # Log metrics
+        logger.info(
+            "[Module B] Processed batch of %d events in %.2f s (first fragment after %.2f s, tokens: %s, cached prompt tokens: %s)",
+            len(events),
+            latency,
+            first_fragment_latency,
+            getattr(usage, 'total_tokens', None),
+            # Provider-side prompt caching kicks in on its own for a repeated prefix; this shows whether it hits
+            getattr(getattr(usage, 'prompt_tokens_details', None), 'cached_tokens', None)
+        )
+        # Log prompt
+        logger.info(f'  Comment:\n{comment}')
+
+        self.last_commentary_time = time.time()
+
+    async def _create_completion(self, **kwargs):
+        """chat.completions.create on the next deployment, failing over when one is rate limited."""
+        attempts = len(self.deployments) * self.max_rate_limit_passes
+        for attempt in range(attempts):
+            deployment = self._next_deployment()
+            try:
+                return await self.client.chat.completions.create(model=deployment, **kwargs)
+            except RateLimitError:
+                if attempt == attempts - 1:
+                    raise
+                logger.warning(f"⏳ Deployment {deployment} is rate limited, trying the next one")
+                if (attempt + 1) % len(self.deployments) == 0:
+                    # Every deployment is saturated, back off before the next pass
+                    await asyncio.sleep(self.rate_limit_backoff * 2 ** (attempt // len(self.deployments)))
+
+    def _compact_events(self, events: List[Tuple[dict, str]]) -> List[str]:
+        """Drop superseded events and fold runs of 3+ same-type events into one summary.
+
+        Returns JSON objects: kept events as received, summaries freshly serialized.
+        """
+        # Walk backwards so each event knows which types a later event already covers
+        kept = []
+        superseded_types = set()
+        for event, raw in reversed(events):
+            if event["type"] in superseded_types:
+                continue
+            kept.append((event, raw))
+            superseded_types.update(SUPERSEDED_BY.get(event["type"], ()))
+        events = kept[::-1]
+
+        compacted = []
+        for event_type, group in groupby(events, key=lambda e: e[0]["type"]):
+            group = list(group)
+            if len(group) <= 2 or event_type in UNCOMPACTED_TYPES:
+                compacted.extend(raw for event, raw in group)
+                continue
+            group = [event for event, raw in group]
+            players = []
+            for event in group:
+                player = next((event[f] for f in PLAYER_FIELDS if event.get(f)), None)
+                name = self._player_name(player) if player else None
+                if name and (not players or players[-1] != name):
+                    players.append(name)
+            compacted.append(orjson.dumps({
+                "type": event_type,
+                "count": len(group),
+                "players": players,
+                "match_time_first": group[0].get("match_time"),
+                "match_time_last": group[-1].get("match_time"),
+            }).decode())
+        return compacted
+
+    @staticmethod
+    def _player_name(player) -> str:
+        if isinstance(player, dict):
+            return " ".join(filter(None, (player.get("first_name"), player.get("last_name"))))
+        return str(player)
+
+    def _split_fragment(self, buffer: str) -> tuple:
+        """Cut a finished sentence (or a long enough run of words) off the front of buffer."""
+        stripped = buffer.rstrip()
+        if stripped.endswith(SENTENCE_ENDINGS):
+            return stripped.strip(), ""
+        head, sep, tail = buffer.rpartition(" ")
+        # Only cut at whitespace so a word split across tokens stays whole
+        if sep and len(head.split()) >= self.max_fragment_words:
+            return head.strip(), tail
+        return "", buffer
+
+    def _enqueue(self, event: data_pb2.Event) -> Optional[str]:
+        """Queue the event; returns its type if a commentary should be generated now."""
+        raw = event.data
+        event = orjson.loads(raw)
+        self.events_queue.append((event, raw))
+        if len(self.events_queue) > self.max_queued_events:
+            self._evict_event()
+        should_comment = time.time() - self.last_commentary_time > self.max_commentary_interval or \
+            event["type"] in TRIGGER_PRIORITY
+        return event["type"] if should_comment else None
+
+    async def submit(self, event: data_pb2.Event) -> None:
+        """Hand an event to the worker; only waits if the inbox is full."""
+        await self._inbox.put(event)
+
+    async def worker(self, sink: CommentarySink) -> None:
+        """Consume the inbox forever, passing every commentary to sink as it is generated.
+
+        Triggers arriving within coalesce_window of the first one share its LLM call and only
+        raise the importance of the commentary. Delivery runs in its own task, one commentary
+        at a time and in order, so the worker keeps draining the inbox while Module C speaks.
+        """
+        loop = asyncio.get_running_loop()
+        deliveries: "asyncio.Queue[Tuple[str, asyncio.Queue, Optional[float]]]" = asyncio.Queue()
+        delivery = asyncio.create_task(self._deliver(deliveries, sink))
+        try:
+            while True:
+                await self._handle(await self._inbox.get(), deliveries, loop)
+        finally:
+            delivery.cancel()
 
+    async def _handle(self, event: data_pb2.Event, deliveries: asyncio.Queue, loop) -> None:
+        """Update the queue with one inbox event and generate a commentary if it triggers one."""
+        try:
+            event_type = self._enqueue(event)
+            if not event_type:
+                return
+            comment_id = event.id
+
+            local_text = self._local_commentary()
+            if local_text:
+                logger.info(f'  Local comment:\n{local_text}')
+                # A play-by-play line is only worth saying while it is current
+                expires_at = time.time() + self.local_commentary_window
+                await self._hand_off(deliveries, comment_id, self._single_fragment(local_text), expires_at)
+                return
+
+            deadline = loop.time() + self.coalesce_window
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    event = await asyncio.wait_for(self._inbox.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                later_type = self._enqueue(event)
+                if later_type:
+                    event_type = self._most_important(event_type, later_type)
+                    comment_id = event.id
+
+            await self._hand_off(deliveries, comment_id, self.stream_commentary(event_type))
         except Exception as e:
-            logger.error(f"Error processing batch of {len(self.events_queue)} events: {str(e)}")
-
-            self.events_queue.clear()
-            return ""
-        
-    def process(self, event: data_pb2.Event) -> str:
-        event = json.loads(event.data)
-        self.events_queue.append(event)
-
-        if time.time() - self.last_commentary_time > self.max_commentary_interval or \
-            event["type"] in ["inicio_del_partido",
-                             "fin_del_partido",
-                             "gol",
-                             "disparo",
-                             "pelota_parada",
-                             "pase"]:
-            return self.generate_commentary(event["type"])
-        return ""
+            logger.error(f"Error handling event (id={event.id}): {str(e)}")
+
+    @staticmethod
+    async def _hand_off(deliveries: asyncio.Queue, comment_id: str, source: AsyncIterator[str],
+                        expires_at: Optional[float] = None) -> None:
+        """Generate a commentary into its own fragment queue, which the delivery task streams out."""
+        fragments: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+        deliveries.put_nowait((comment_id, fragments, expires_at))
+        try:
+            async for fragment in source:
+                fragments.put_nowait(fragment)
+        finally:
+            fragments.put_nowait(None)  # end of commentary, even if generation failed
+
+    @staticmethod
+    async def _deliver(deliveries: asyncio.Queue, sink: CommentarySink) -> None:
+        """Pass commentaries to sink in generation order, each streamed as its fragments arrive."""
+        async def drain(fragments: asyncio.Queue) -> AsyncIterator[str]:
+            while (fragment := await fragments.get()) is not None:
+                yield fragment
+
+        while True:
+            comment_id, fragments, expires_at = await deliveries.get()
+            # Local lines go stale: skip them once expired or once a newer commentary is waiting
+            if expires_at is not None and (time.time() > expires_at or not deliveries.empty()):
+                logger.info(f"⏭️  Skipping stale local commentary (id={comment_id})")
+                continue
+            try:
+                await sink(comment_id, drain(fragments))
+            except Exception as e:
+                logger.error(f"Error delivering commentary (id={comment_id}): {str(e)}")
+
+    @staticmethod
+    async def _single_fragment(text: str) -> AsyncIterator[str]:
+        yield text
+
+    def _local_commentary(self) -> Optional[str]:
+        """Narrate the queue without the LLM when it only holds routine events.
+
+        The queue is consumed when a local commentary is returned.
+        """
+        if time.time() - self.last_commentary_time >= self.local_commentary_window:
+            return None
+        event = None
+        for queued, raw in self.events_queue:
+            if queued["type"] in self._local_templates:
+                event = queued
+            elif queued["type"] in TRIGGER_PRIORITY:
+                # Something worth a real commentary is waiting
+                return None
+        if event is None or event.get("pase_completado") is False:
+            return None
+        template, player_field = self._local_templates[event["type"]]
+        player = event.get(player_field)
+        if not isinstance(player, dict) or not player.get("last_name"):
+            return None
+        self.events_queue = []
+        return template.format(player=player["last_name"])
+
+    def _evict_event(self) -> None:
+        """Drop the least important queued event."""
+        for event_type in EVICTION_ORDER:
+            index = next((i for i, (queued, raw) in enumerate(self.events_queue)
+                          if queued["type"] == event_type), None)
+            if index is not None:
+                break
+        else:
+            index = 0  # only key events left, the oldest one goes
+        dropped, _ = self.events_queue.pop(index)
+        logger.warning(f"⚠️  Event queue full, dropped {dropped['type']} event (id={dropped.get('event_id')})")
+
+    @staticmethod
+    def _most_important(*event_types: str) -> str:
+        """Pick the type whose prompt should drive a shared commentary."""
+        return min(event_types, key=lambda t: TRIGGER_PRIORITY.get(t, len(TRIGGER_PRIORITY)))
     
 
 
@@ -240,9 +577,9 @@ class EventToText:
 
 
 
-    def gen_dataset(self, messages: List[dict], response: str, json_path: str) -> None:
+    def gen_dataset(self, messages: List[dict], response: str) -> None:
         """
-        Generate a dataset entry from messages and response and append it into a JSON array file.
+        Generate a dataset entry from messages and response and buffer it for the JSONL dataset.
 
         Each entry has the structure:
         {
@@ -250,7 +587,7 @@ class EventToText:
             "output": "LLM response"
         }
 
-        The JSON file at `json_path` will be maintained as a list of such entries.
+        Entries end up in `self.dataset_path` one per line; see `_flush_dataset`.
         Leading occurrences of 'default\n' in the combined input are removed.
         """
         # 1) Extract and clean system prompt
@@ -264,133 +601,121 @@ class EventToText:
         # Combine, then strip unwanted default prefixes
         input_text = f"{system_text}\n\n{all_user_text}".strip()
         # Remove any leading 'default' lines
-        input_text = re.sub(r"^default\s*\n+", "", input_text)
+        input_text = DEFAULT_PREFIX_RE.sub("", input_text)
 
         entry = {
             "input": input_text,
             "output": response.strip()
         }
 
-        # Load existing entries if any
-        try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                entries = json.load(f)
-                if not isinstance(entries, list):
-                    entries = []
-        except (FileNotFoundError, json.JSONDecodeError):
-            entries = []
-
-        # Append and write back
-        entries.append(entry)
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(entries, f, ensure_ascii=False, indent=4)
-
-
+        with self._dataset_lock:
+            self._dataset_buffer.append(orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE))
+            full = len(self._dataset_buffer) >= self.dataset_flush_size
+        if full:
+            self._flush_dataset()
+
+    def _flush_dataset(self) -> None:
+        """Append every buffered dataset entry with a single write."""
+        with self._dataset_lock:
+            entries, self._dataset_buffer = self._dataset_buffer, []
+        if not entries:
+            return
+        with open(self.dataset_path, 'ab') as f:
+            f.write(b"".join(entries))
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def _dataset_flush_loop(self) -> None:
+        """Flush the dataset buffer on the I/O thread every dataset_flush_interval seconds."""
+        while True:
+            await asyncio.sleep(self.dataset_flush_interval)
+            if self._dataset_buffer:
+                self._write_in_background(self._flush_dataset)
+
+    def _write_in_background(self, fn, *args) -> None:
+        """Run a file-writing helper on the I/O thread and log it if it fails."""
+        self._io_executor.submit(fn, *args).add_done_callback(self._log_write_error)
+
+    @staticmethod
+    def _log_write_error(future: Future) -> None:
+        if future.exception() is not None:
+            logger.error(f"Error writing LLM call files: {future.exception()}")
 
     def _add_to_conversation(self, user_message: str, assistant_message: str):
         """Add a user-assistant exchange to conversation history."""
-        self.conversation_history.append({"role": "user", "content": user_message})
-        self.conversation_history.append({"role": "assistant", "content": assistant_message})
+        for role, content in (("user", user_message), ("assistant", assistant_message)):
+            n_tokens = len(self._encoder.encode(content))
+            self.conversation_history.append({"role": role, "content": content})
+            self._history_token_counts.append(n_tokens)
+            self._history_tokens += n_tokens
         
-        # Keep only last N exchanges (N*2 messages)
-        max_messages = self.max_history_exchanges * 2
-        if len(self.conversation_history) > max_messages:
-            self.conversation_history = self.conversation_history[-max_messages:]
-
-    def _build_messages(self, system_prompt: str, user_message: str) -> List[dict]:
+        # Drop the oldest exchanges (user + assistant pairs) until the history fits the budget
+        dropped = []
+        while self._history_tokens > self.max_history_tokens and len(self.conversation_history) > 2:
+            for _ in range(2):
+                dropped.append(self.conversation_history.popleft())
+                self._history_tokens -= self._history_token_counts.popleft()
+
+        if dropped:
+            # Summarize off the request path; keep a reference so the task is not collected
+            task = asyncio.create_task(self._condense_history(dropped))
+            self._condense_tasks.add(task)
+            task.add_done_callback(self._condense_tasks.discard)
+
+    async def _condense_history(self, msgs: List[dict]):
+        """Fold trimmed exchanges into history_summary so later calls still know what was narrated."""
+        # Only the commentary is needed to avoid repeating it; the event JSON would just cost tokens
+        comments = "\n".join(m["content"] for m in msgs if m["role"] == "assistant")
+        # One condensation at a time, so each one builds on the previous summary
+        async with self._condense_lock:
+            previous = f"Resumen anterior: {self.history_summary}\n\n" if self.history_summary else ""
+            try:
+                response = await self._create_completion(
+                    messages=[
+                        {"role": "system", "content": (
+                            "Resumí en no más de 100 palabras qué eventos y frases ya se relataron en el partido, "
+                            "para que el relator no los repita. Respondé solo con el resumen."
+                        )},
+                        {"role": "user", "content": f"{previous}Comentarios ya relatados:\n{comments}"},
+                    ],
+                    max_tokens=self.summary_max_tokens,
+                    temperature=0.3,
+                )
+                self.history_summary = response.choices[0].message.content.strip()
+                logger.debug(f"🗜️  Condensed {len(msgs)} history messages into summary: {self.history_summary}")
+            except Exception as e:
+                logger.error(f"Error condensing {len(msgs)} history messages: {str(e)}")
+
+    def _build_messages(self, event_type: str, user_message: str) -> List[dict]:
         """Build the complete message list with system prompt and conversation history."""
-        messages = [{"role": "system", "content": system_prompt}]
+        messages = self._system_headers.get(event_type, self._system_headers["default"]).copy()
+        if self.history_summary:
+            messages.append({"role": "system", "content": f"Resumen de relato previo: {self.history_summary}"})
         messages.extend(self.conversation_history)
         messages.append({"role": "user", "content": user_message})
         return messages
 
-    def _save_debug_call(self, call_type: str, messages: List[dict], response_content: str, latency: float):
+    def _save_debug_call(self, call_number: int, call_type: str, messages: List[dict], events: List[dict],
+                         response_content: str, latency: float):
         """Save LLM call details to debug file."""
-        self.call_counter += 1
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"llm_call_{self.call_counter:03d}_{call_type}.json"
-        
-        # Process messages to make embedded JSON readable
-        readable_messages = []
-        for msg in messages:
-            readable_msg = msg.copy()
-            if msg["role"] == "user" and ("evento del juego:" in msg["content"].lower() or "eventos del juego:" in msg["content"].lower()):
-                readable_msg["content_formatted"] = self._format_user_content(msg["content"])
-            readable_messages.append(readable_msg)
+        filename = f"llm_call_{call_number:03d}_{call_type}.json"
         
         debug_data = {
             "timestamp": timestamp,
-            "call_number": self.call_counter,
+            "call_number": call_number,
             "call_type": call_type,
             "latency_seconds": latency,
-            "messages_sent": readable_messages,
+            "messages_sent": messages,
+            # The batch as parsed on arrival, so the prompt never has to be parsed back
+            "events": events,
             "response_content": response_content,
             "conversation_history_length": len(self.conversation_history)
         }
         
+        self.debug_dir.mkdir(exist_ok=True)
         debug_file = self.debug_dir / filename
-        with open(debug_file, 'w', encoding='utf-8') as f:
-            json.dump(debug_data, f, indent=2, ensure_ascii=False)
+        with open(debug_file, 'wb') as f:
+            f.write(orjson.dumps(debug_data, option=orjson.OPT_INDENT_2))
         
         logger.debug(f"💾 Saved debug call to {filename}")
-
-    def _format_user_content(self, content: str) -> dict:
-        """Format user content to make embedded JSON events readable."""
-        try:
-            lines = content.split('\n')
-            formatted_content = {
-                "instruction": "",
-                "events": [],
-                "request": ""
-            }
-            
-            current_section = "instruction"
-            current_event_json = ""
-            
-            for line in lines:
-                if line.strip().startswith('{"event_id"'):
-                    if current_event_json:
-                        # Parse previous event
-                        try:
-                            event_data = json.loads(current_event_json)
-                            formatted_content["events"].append(event_data)
-                        except:
-                            formatted_content["events"].append({"raw": current_event_json})
-                    current_event_json = line.strip()
-                    current_section = "events"
-                elif line.strip() == "---":
-                    if current_event_json:
-                        # Parse current event
-                        try:
-                            event_data = json.loads(current_event_json)
-                            formatted_content["events"].append(event_data)
-                        except:
-                            formatted_content["events"].append({"raw": current_event_json})
-                        current_event_json = ""
-                elif line.strip().startswith("Genera un relato"):
-                    if current_event_json:
-                        # Parse last event
-                        try:
-                            event_data = json.loads(current_event_json)
-                            formatted_content["events"].append(event_data)
-                        except:
-                            formatted_content["events"].append({"raw": current_event_json})
-                        current_event_json = ""
-                    formatted_content["request"] = line.strip()
-                    current_section = "request"
-                elif current_section == "instruction":
-                    formatted_content["instruction"] += line + "\n"
-            
-            # Handle last event if exists
-            if current_event_json:
-                try:
-                    event_data = json.loads(current_event_json)
-                    formatted_content["events"].append(event_data)
-                except:
-                    formatted_content["events"].append({"raw": current_event_json})
-            
-            formatted_content["instruction"] = formatted_content["instruction"].strip()
-            return formatted_content
-            
-        except Exception as e:
-            return {"error": f"Failed to format content: {e}", "raw_content": content}
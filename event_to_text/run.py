@@ -1,12 +1,14 @@
+import asyncio
 import logging
-from concurrent import futures
 import os
 os.environ["GRPC_VERBOSITY"] = "ERROR"
 import grpc
+import uvloop
 from utils.discovery_utils import (
     get_env_var, 
     get_service_endpoint_from_discovery, 
-    start_grpc_server_with_discovery
+    serve_grpc_aio_server_with_discovery,
+    GRPC_CHANNEL_OPTIONS
 )
 from proto import data_pb2, data_pb2_grpc
 # from module_b.dummy_event_to_text import EventToText
@@ -22,40 +24,65 @@ class ModuleBServicer(data_pb2_grpc.ModuleBServicer):
     """Receives events from Module A and forwards text to Module C."""
 
     def __init__(self):
-        # Create a single channel to Module C for reuse
-        self._c_channel = grpc.insecure_channel(MODULE_C_HOST)
+        # Create a single channel to Module C for reuse (must be built on the serving event loop)
+        self._c_channel = grpc.aio.insecure_channel(MODULE_C_HOST, options=GRPC_CHANNEL_OPTIONS)
         self._c_stub = data_pb2_grpc.ModuleCStub(self._c_channel)
         logging.info(f"✅ Initialized connection to Module C at {MODULE_C_HOST}")
 
         # Processing component – heavy NLP, can tune delays
         self.eventToText = EventToText()
 
-    def ProcessEvent(self, request: data_pb2.Event, context):  # noqa: N802 (grpc naming)
+    async def ProcessEvent(self, request: data_pb2.Event, context):  # noqa: N802 (grpc naming)
+        # The commentary is produced by the EventToText worker; TTS results only show up in its logs
         logging.info(f"📥 Received event (id={request.id})")
-        text = self.eventToText.process(request)
-        if not text:
-            msg = f"❌ No text generated for event (id={request.id})"
-            return data_pb2.BasicResponse(id=request.id, success=True, message=msg)
-        logging.info(f"➡️  Forwarding text (id={request.id}) to Module C")
+        await self.eventToText.submit(request)
+        return data_pb2.BasicResponse(id=request.id, success=True, message="Event queued")
+
+    async def ProcessEvents(self, request_iterator, context):  # noqa: N802 (grpc naming)
+        """Streaming variant used by Module A: answers each event in arrival order."""
+        logging.info(f"🔗 Event stream opened by {context.peer()}")
+        async for request in request_iterator:
+            yield await self.ProcessEvent(request, context)
+        logging.info("🔌 Event stream closed")
+
+    async def forward_commentary(self, comment_id: str, fragments):
+        """EventToText sink: stream a commentary to Module C as its fragments are generated."""
+        first = await anext(fragments, None)
+        if first is None:
+            logging.info(f"❌ No text generated for event (id={comment_id})")
+            return
+
+        async def comments():
+            # Module C starts synthesizing the first fragment while the rest is still being generated
+            yield data_pb2.Comment(id=comment_id, text=first)
+            async for fragment in fragments:
+                yield data_pb2.Comment(id=comment_id, text=fragment)
+
+        logging.info(f"➡️  Streaming text (id={comment_id}) to Module C")
         try:
-            response_c = self._c_stub.TextToSpeech(
-                data_pb2.Comment(id=request.id, text=text)
-            )
-            success = response_c.success
-            msg = response_c.message
+            response_c = await self._c_stub.StreamText(comments())
+            if not response_c.success:
+                logging.error(f"❌ Module C failed on text (id={comment_id}): {response_c.message}")
         except grpc.RpcError as exc:
-            success = False
-            msg = f"❌ Failed to forward text to Module C: {exc.details()}"
-            logging.error(msg)
-        return data_pb2.BasicResponse(id=request.id, success=success, message=msg)
+            logging.error(f"❌ Failed to forward text to Module C: {exc.details()}")
+
+    def start(self):
+        """Start the EventToText worker; must be called on the serving event loop."""
+        self._worker = asyncio.create_task(self.eventToText.worker(self.forward_commentary))
 
+    async def close(self):
+        self._worker.cancel()
+        await self.eventToText.close()
+        await self._c_channel.close()
 
-def main():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=8))
-    data_pb2_grpc.add_ModuleBServicer_to_server(ModuleBServicer(), server)
+async def main():
+    server = grpc.aio.server()
+    servicer = ModuleBServicer()
+    servicer.start()
+    data_pb2_grpc.add_ModuleBServicer_to_server(servicer, server)
     
-    # Start server with discovery registration and graceful shutdown
-    start_grpc_server_with_discovery(
+    # Serve with discovery registration and graceful shutdown
+    await serve_grpc_aio_server_with_discovery(
         server=server,
         service_name=SERVICE_NAME,
         host_address=MODULE_B_HOST,
@@ -63,9 +90,11 @@ def main():
             "version": "1.0.0",
             "type": "event_processor",
             "description": "Converts events to text"
-        }
+        },
+        on_shutdown=servicer.close
     )
 
 
 if __name__ == "__main__":
-    main() 
+    # libuv-based event loop: cheaper callbacks for the LLM and gRPC I/O sharing it
+    uvloop.run(main()) 
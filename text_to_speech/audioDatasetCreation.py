@@ -14,10 +14,13 @@ logging.basicConfig(
 )
 
 import csv, pathlib, tempfile, textwrap
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import List
+from typing import List, Optional, Tuple
+import librosa
+import numpy as np
+import soundfile as sf
 from tqdm import tqdm
-from pydub import AudioSegment
 from openai import AzureOpenAI, BadRequestError
 from fetch_api_keys import parse_settings
 
@@ -32,11 +35,19 @@ AUDIO_ROOT              = pathlib.Path("dataset_coqui/chunks_closs")
 MAX_UPLOAD_MIB = 25
 TARGET_SR      = 22_050 
 CHUNK_SEC      = 30
+# Every upload is mono PCM16 at TARGET_SR, so the size limit is a sample count
+WAV_HEADER_BYTES = 44
+MAX_SAMPLES      = (MAX_UPLOAD_MIB * 1024 * 1024 - WAV_HEADER_BYTES) // 2
+
+# Transcription is network-bound: keep several uploads in flight
+WHISPER_WORKERS = 16   # concurrent Whisper requests, shared by every file
+FILE_WORKERS    = 4    # files being converted/transcribed at once
 
 OUTPUT_DIR   = pathlib.Path("dataset_coqui")
 OUTPUT_WAVS  = OUTPUT_DIR / "wavs"
 OUTPUT_TXTS  = OUTPUT_DIR / "transcriptions"
 METADATA_CSV = OUTPUT_DIR / "metadata.csv"
+METADATA_FMT = dict(delimiter="|", quoting=csv.QUOTE_NONE, escapechar="\\")
 
 TMP_DIR      = tempfile.TemporaryDirectory()
 
@@ -58,11 +69,8 @@ def ensure_dirs():
     OUTPUT_WAVS.mkdir(parents=True, exist_ok=True)
     OUTPUT_TXTS.mkdir(parents=True, exist_ok=True)
 
-def bytes_to_mib(n_bytes: int) -> float:
-    return n_bytes / (1024 * 1024)
-
-def save_audiosegment(seg: AudioSegment, path: pathlib.Path):
-    seg.export(path, format="wav")
+def save_wav(audio: np.ndarray, path: pathlib.Path):
+    sf.write(path, audio, TARGET_SR, subtype="PCM_16")
 
 def whisper(path: pathlib.Path) -> str:
     try:
@@ -79,110 +87,122 @@ def whisper(path: pathlib.Path) -> str:
         logging.info("BAD_FILE %s  - %s", path, e)
         raise
 
-def convert_to_wav(src: pathlib.Path) -> pathlib.Path:
-    if src.suffix.lower() == ".wav":
-        audio = AudioSegment.from_wav(src)
-    else:
-        audio = AudioSegment.from_file(src)
+def transcribe_chunk(path: pathlib.Path) -> str:
+    # Retry once when Whisper returns a suspiciously short transcript
+    for attempt in (1, 2):
+        text = whisper(path).strip()
+        if len(text) >= 10 or attempt == 2:
+            return text
+
+def convert_to_wav(src: pathlib.Path, dst: pathlib.Path) -> Tuple[pathlib.Path, np.ndarray]:
+    """Decode once; return the path to upload plus the mono TARGET_SR samples for splitting."""
+    with sf.SoundFile(str(src)) as f:
+        sr, subtype = f.samplerate, f.subtype
+        data = f.read(dtype="float32", always_2d=True)
+
+    need_sr   = sr            != TARGET_SR
+    need_mono = data.shape[1] != 1
 
-    need_sr   = audio.frame_rate != TARGET_SR
-    need_mono = audio.channels   != 1
+    audio = data.mean(axis=1) if need_mono else data[:, 0]
 
-    if not need_sr and not need_mono and src.suffix.lower() == ".wav":
-        return src
+    # Only a mono PCM16 source can be uploaded as is, since MAX_SAMPLES assumes 2 bytes per sample
+    if not need_sr and not need_mono and src.suffix.lower() == ".wav" and subtype == "PCM_16":
+        return src, audio
 
-    if need_mono:
-        audio = audio.set_channels(1)
+    # Resample in memory instead of a pydub/ffmpeg round-trip
     if need_sr:
-        audio = audio.set_frame_rate(TARGET_SR)
+        audio = librosa.resample(audio, orig_sr=sr, target_sr=TARGET_SR)
 
-    dst = pathlib.Path(TMP_DIR.name) / f"{src.stem}_{TARGET_SR//1000}k.wav"
-    save_audiosegment(audio, dst)
-    return dst
+    save_wav(audio, dst)
+    return dst, audio
 
-def split_if_needed(wav: pathlib.Path) -> List[pathlib.Path]:
-    if bytes_to_mib(wav.stat().st_size) <= MAX_UPLOAD_MIB:
+def split_if_needed(wav: pathlib.Path, audio: np.ndarray, file_id: str) -> List[pathlib.Path]:
+    if audio.shape[0] <= MAX_SAMPLES:
         return [wav]
 
-    audio = AudioSegment.from_wav(wav)
+    # Slice the already-decoded samples instead of reading the WAV back
     pieces = []
-    for i in range(0, len(audio), CHUNK_SEC * 1000):
-        chunk = audio[i : i + CHUNK_SEC * 1000]
-        tmp = pathlib.Path(TMP_DIR.name) / f"{wav.stem}_{i//1000:05d}.wav"
-        save_audiosegment(chunk, tmp)
+    step = CHUNK_SEC * TARGET_SR
+    for i in range(0, audio.shape[0], step):
+        # Named after the file id: sources can share a stem and are processed concurrently
+        tmp = pathlib.Path(TMP_DIR.name) / f"{file_id}_{i//TARGET_SR:05d}.wav"
+        save_wav(audio[i : i + step], tmp)
         pieces.append(tmp)
 
     return pieces
 
 def create_metadata(input_csv: pathlib.Path, output_csv: pathlib.Path) -> None:
-    rows = []
-    with input_csv.open("r", encoding="utf-8") as f:
-        reader = csv.reader(f, delimiter="|", quoting=csv.QUOTE_NONE, escapechar="\\")
-        for row in reader:
-            if len(row) != 2:
-                continue
-            audio_file, text = row
-            rows.append((audio_file, text, text))
-
-    with output_csv.open("w", encoding="utf-8", newline="") as f:
-        writer = csv.writer(f, delimiter="|", quoting=csv.QUOTE_NONE, escapechar="\\")
-        writer.writerows(rows)
+    """Copy a two-column file|text CSV to the file|text|text layout, one row at a time."""
+    with input_csv.open("r", encoding="utf-8") as fi, \
+            output_csv.open("w", encoding="utf-8", newline="") as fo:
+        reader = csv.reader(fi, **METADATA_FMT)
+        csv.writer(fo, **METADATA_FMT).writerows(
+            (audio_file, text, text) for audio_file, text in (row for row in reader if len(row) == 2)
+        )
+
+def process_file(idx: int, src: pathlib.Path, whisper_pool: ThreadPoolExecutor) -> Optional[List[str]]:
+    try:
+        file_id = f"{idx:05d}"
+        wav_dst = OUTPUT_WAVS / f"{file_id}.wav"
+        txt_dst = OUTPUT_TXTS / f"{file_id}.txt"
+
+        # Converted audio goes straight to its final place unless a previous run left one there
+        convert_dst = wav_dst if not wav_dst.exists() else pathlib.Path(TMP_DIR.name) / f"{file_id}_{TARGET_SR//1000}k.wav"
+        wav_tmp, audio = convert_to_wav(src, convert_dst)
+        chunks = split_if_needed(wav_tmp, audio, file_id)
+
+        # All chunks are uploaded concurrently; results are gathered in order
+        futures = [whisper_pool.submit(transcribe_chunk, part) for part in chunks]
+        full_text: List[str] = []
+        for part, future in zip(chunks, futures):
+            try:
+                full_text.append(future.result())
+            except BadRequestError:
+                tqdm.write(f"Skipping corrupt chunk: {part}")
+                for pending in futures:
+                    pending.cancel()
+                break
+
+        transcript = "\n".join(full_text)
+
+        if not wav_dst.exists():
+            if wav_tmp != wav_dst:
+                wav_tmp.replace(wav_dst)
+            else:
+                wav_tmp.rename(wav_dst)
+
+        txt_dst.write_text(transcript, encoding="utf-8")
+        return [wav_dst.name, transcript]
+
+    except BadRequestError:
+        tqdm.write(f"Skipped corrupt file: {src}")
+        return None
 
 def main():
     ensure_dirs()
-    rows = []
     audio_files = sorted(
         p for p in AUDIO_ROOT.rglob("*") if p.suffix.lower() in {".mp3", ".wav"}
     )
 
-    for idx, src in enumerate(tqdm(audio_files, desc="Files")):
-        try:
-            file_id = f"{idx:05d}"
-            wav_dst = OUTPUT_WAVS / f"{file_id}.wav"
-            txt_dst = OUTPUT_TXTS / f"{file_id}.txt"
-
-            wav_tmp = convert_to_wav(src)
-            chunks = split_if_needed(wav_tmp)
-
-            full_text: List[str] = []
-            for part in chunks:
-                try:
-                    for attempt in (1, 2):
-                        text = whisper(part).strip()
-                        if len(text) >= 10 or attempt == 2:
-                            break
-                    full_text.append(text)
-                except BadRequestError:
-                    tqdm.write(f"Skipping corrupt chunk: {part}")
-                    break
-
-            transcript = "\n".join(full_text)
-
-            if not wav_dst.exists():
-                if wav_tmp != wav_dst:
-                    wav_tmp.replace(wav_dst)
-                else:
-                    wav_tmp.rename(wav_dst)
-
-            txt_dst.write_text(transcript, encoding="utf-8")
-            rows.append([wav_dst.name, transcript])
-
-        except BadRequestError:
-            tqdm.write(f"Skipped corrupt file: {src}")
-            continue
-
+    results: List[Optional[List[str]]] = [None] * len(audio_files)
+    with ThreadPoolExecutor(max_workers=WHISPER_WORKERS) as whisper_pool, \
+            ThreadPoolExecutor(max_workers=FILE_WORKERS) as file_pool:
+        futures = {
+            file_pool.submit(process_file, idx, src, whisper_pool): idx
+            for idx, src in enumerate(audio_files)
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Files"):
+            results[futures[future]] = future.result()
+    rows = [row for row in results if row is not None]
+
+    # Written in its final file|text|text layout, no create_metadata pass over the same file
     with METADATA_CSV.open("w", newline="", encoding="utf-8") as f:
-        csv.writer(f, delimiter="|").writerows(rows)
-
-    
-    metadata = OUTPUT_DIR / "metadata.csv"
-    create_metadata(METADATA_CSV, metadata)
+        csv.writer(f, **METADATA_FMT).writerows((name, text, text) for name, text in rows)
 
     print(f"Finished {len(rows)} recordings.")
     print(f"WAVs: {OUTPUT_WAVS.resolve()}")
     print(f"TXT: {OUTPUT_TXTS.resolve()}")
     print(f"CSV: {METADATA_CSV.resolve()}")
-    print(f"CSV: {metadata.resolve()}")
 
 if __name__ == "__main__":
     t0 = datetime.now()
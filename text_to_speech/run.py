@@ -1,11 +1,14 @@
 from utils.discovery_utils import (
     get_env_var,
     get_service_endpoint_from_discovery,
-    start_grpc_server_with_discovery
+    serve_grpc_aio_server_with_discovery,
+    GRPC_CHANNEL_OPTIONS
 )
+import asyncio
 import logging
 from utils.logging_config import setup_logging
 from concurrent import futures
+from itertools import count
 import os
 os.environ["GRPC_VERBOSITY"] = "ERROR"
 import grpc
@@ -19,43 +22,162 @@ logger = logging.getLogger("Module C")
 SERVICE_NAME = "module_c"
 MODULE_C_HOST = get_env_var("MODULE_C_HOST", "0.0.0.0:50053")
 MODULE_D_HOST = get_env_var("MODULE_D_HOST") or get_service_endpoint_from_discovery("module_d")
+# Requests synthesizing at once; the rest wait on the event loop without holding a thread
+TTS_CONCURRENT_REQUESTS = int(get_env_var("TTS_CONCURRENT_REQUESTS", "3"))
+SERVER_OPTIONS = [
+    ("grpc.so_reuseport", 1),
+    ("grpc.max_concurrent_streams", 100),
+    ("grpc.keepalive_time_ms", 30000),
+]
+
+class _PlaybackTurn:
+    """One request's place in the playback order.
+
+    Module D plays clips strictly by audio id, so a request only takes ids once every
+    earlier request has taken all of its own; clips synthesized before then are held.
+    """
+
+    def __init__(self, forward_audio, previous: "asyncio.Future | None"):
+        self._forward_audio = forward_audio
+        self._previous = previous
+        self._held = []
+        self.pending = []  # PlayAudio calls already sent, in id order
+        self.done = asyncio.get_running_loop().create_future()
+
+    def forward(self, audio_bytes: bytes):
+        self._held.append(audio_bytes)
+        if self._previous is None or self._previous.done():
+            self._release()
+
+    def _release(self):
+        self.pending.extend(self._forward_audio(audio) for audio in self._held)
+        self._held.clear()
+
+    async def finish(self):
+        """Send whatever is still held once it is this request's turn, then pass the turn on."""
+        try:
+            if self._previous is not None:
+                await asyncio.shield(self._previous)
+            self._release()
+        finally:
+            if self._previous is None or self._previous.done():
+                self.done.set_result(None)
+            else:
+                # Cancelled while waiting: the next request still has to wait for ours
+                self._previous.add_done_callback(lambda _: self.done.set_result(None))
+
 
 class ModuleCServicer(data_pb2_grpc.ModuleCServicer):
     def __init__(self):
-        self._d_channel = grpc.insecure_channel(MODULE_D_HOST)
+        self._d_channel = grpc.aio.insecure_channel(MODULE_D_HOST, options=GRPC_CHANNEL_OPTIONS)
         self._d_stub = data_pb2_grpc.ModuleDStub(self._d_channel)
         logger.info(f"✅ Initialized connection to Module D at {MODULE_D_HOST}")
 
         # processing component
         self.TextToAudio = TextToAudio()
-        self._audio_counter = 0          # new
+        self._audio_ids = count()  # only the event loop takes ids, so they stay in arrival order
+        self._last_turn = None  # done once the latest request has taken all of its audio ids
+        # Backpressure: at most TTS_CONCURRENT_REQUESTS syntheses in flight, each driven on its own thread
+        self._synthesis_slots = asyncio.Semaphore(TTS_CONCURRENT_REQUESTS)
+        self._tts_pool = futures.ThreadPoolExecutor(max_workers=TTS_CONCURRENT_REQUESTS, thread_name_prefix="tts")
 
-    def TextToSpeech(self, request: data_pb2.Comment, context):  # noqa: N802
+    async def TextToSpeech(self, request: data_pb2.Comment, context):  # noqa: N802
         logging.info(f"📥 Received text to process (id={request.id})")
-        audio_bytes = self.TextToAudio.process(request)
+        turn = self._take_turn()
+        error = None
+        try:
+            error = await self._synthesize(request, turn)
+        finally:
+            await turn.finish()
+        success, msg = await self._forward_results(turn)
+        if error is not None:
+            success, msg = False, error
+        return data_pb2.BasicResponse(id=request.id, success=success, message=msg)
+
+    async def StreamText(self, request_iterator, context):  # noqa: N802
+        """Synthesize each fragment as soon as it arrives and play it as its own clip."""
+        # The whole stream is one turn, so another comment never plays between its fragments
+        comment_id = None
+        error = None
+        turn = self._take_turn()
+        try:
+            async for request in request_iterator:
+                comment_id = request.id
+                logging.info(f"📥 Received text fragment to process (id={request.id})")
+                # A fragment that fails to synthesize is reported, the rest of the comment still plays
+                error = await self._synthesize(request, turn) or error
+        finally:
+            await turn.finish()
+        success, msg = await self._forward_results(turn)
+        if error is not None:
+            success, msg = False, error
+        elif comment_id is None:
+            msg = "No text received"
+        return data_pb2.BasicResponse(id=comment_id or "", success=success, message=msg)
+
+    def _take_turn(self) -> _PlaybackTurn:
+        turn = _PlaybackTurn(self._forward_audio, self._last_turn)
+        self._last_turn = turn.done
+        return turn
+
+    async def _synthesize(self, request: data_pb2.Comment, turn: _PlaybackTurn):
+        """Hand every synthesized chunk to the request's turn as soon as it is ready; returns the error message, if any."""
+        # Each chunk gets its own ordered audio id, so playback starts after the first chunk;
+        # the PlayAudio calls are in flight while the next chunk is being synthesized
+        loop = asyncio.get_running_loop()
+        async with self._synthesis_slots:
+            clips = self.TextToAudio.iter_process(request)
+            while True:
+                try:
+                    audio_bytes = await loop.run_in_executor(self._tts_pool, next, clips, None)
+                except Exception as exc:
+                    msg = f"❌ Failed to synthesize text (id={request.id}): {exc}"
+                    logging.error(msg)
+                    return msg
+                if audio_bytes is None:
+                    return None
+                turn.forward(audio_bytes)
+
+    async def _forward_results(self, turn: _PlaybackTurn):
+        """Wait for every PlayAudio call of a turn; returns (success, message of the last one)."""
+        success, msg = True, "No audio produced"
+        for call in turn.pending:
+            chunk_success, msg = await self._forward_result(call)
+            success = success and chunk_success
+        return success, msg
+
+    def _forward_audio(self, audio_bytes: bytes) -> grpc.aio.UnaryUnaryCall:
+        """Send one clip to Module D without waiting for its answer."""
         # assign monotonic integer so Module D never needs to remap
-        audio_id = str(self._audio_counter)
-        self._audio_counter += 1
+        audio_id = str(next(self._audio_ids))
         logging.info(f"➡️  Forwarding audio to Module D … (audio_id={audio_id})")        
+        return self._d_stub.PlayAudio(
+            data_pb2.Audio(id=audio_id, audio_data=audio_bytes)
+        )
+
+    @staticmethod
+    async def _forward_result(call: grpc.aio.UnaryUnaryCall):
+        """Wait for one PlayAudio call; returns (success, message)."""
         try:
-            response_d = self._d_stub.PlayAudio(
-                data_pb2.Audio(id=audio_id, audio_data=audio_bytes)
-            )
-            success = response_d.success
-            msg = response_d.message
+            response_d = await call
+            return response_d.success, response_d.message
         except grpc.RpcError as exc:
-            success = False
             msg = f"❌ Failed to forward audio to Module D: {exc.details()}"
             logging.error(msg)
-        return data_pb2.BasicResponse(id=request.id, success=success, message=msg)
+            return False, msg
+
+    async def close(self):
+        await self._d_channel.close()
+        self._tts_pool.shutdown(wait=False)
 
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    data_pb2_grpc.add_ModuleCServicer_to_server(ModuleCServicer(), server)
+async def serve():
+    server = grpc.aio.server(options=SERVER_OPTIONS)
+    servicer = ModuleCServicer()
+    data_pb2_grpc.add_ModuleCServicer_to_server(servicer, server)
     
-    # Start server with discovery registration and graceful shutdown
-    start_grpc_server_with_discovery(
+    # Serve with discovery registration and graceful shutdown
+    await serve_grpc_aio_server_with_discovery(
         server=server,
         service_name=SERVICE_NAME,
         host_address=MODULE_C_HOST,
@@ -63,10 +185,10 @@ def serve():
             "version": "1.0.0",
             "type": "text_to_speech",
             "description": "Converts text to audio"
-        }
+        },
+        on_shutdown=servicer.close
     )
 
 
 if __name__ == "__main__":
-    serve() 
-    
\ No newline at end of file
+    asyncio.run(serve())
@@ -5,63 +5,81 @@ split_segments.py
 Splits an audio file into 4-8 second fragments, cutting only at pauses.
 
 Requirements:
-    pip install pydub librosa soundfile
-    # On Linux: sudo apt-get install ffmpeg  (pydub uses ffmpeg internally)
+    pip install numpy librosa soundfile
 """
 
-from pydub import AudioSegment, silence
 import argparse
 import os
 from pathlib import Path
 
+import librosa
+import numpy as np
+import soundfile as sf
+
 # ---------- "Smart" parameters ---------- #
 TARGET_SR = 22_050          # Hz
 MIN_LEN = 4_000             # ms (4 s)
 MAX_LEN = 8_000             # ms (8 s)
 SILENCE_THRESH = -40        # dBFS, ↓ = more tolerant
 MIN_SIL_MS = 300            # ms of silence needed to consider "pause"
+SEEK_MS = 10                # ms between silence probes, finer → more precise, slower
 # -------------------------------------- #
 
+def ms_to_frames(ms: int) -> int:
+    return ms * TARGET_SR // 1000
+
+
+def find_pauses(audio: np.ndarray) -> np.ndarray:
+    """Start (ms) of every run of silence, probed every SEEK_MS over MIN_SIL_MS windows.
+
+    Same rule as pydub's detect_silence, vectorized over the whole file:
+    window energies come from one cumulative sum instead of a Python loop.
+    """
+    total_ms = len(audio) * 1000 // TARGET_SR
+    probes_ms = np.arange(0, total_ms - MIN_SIL_MS + 1, SEEK_MS)
+    cumulative = np.concatenate(([0.0], np.cumsum(np.square(audio, dtype=np.float64).sum(axis=1))))
+    lo = ms_to_frames(probes_ms)
+    hi = ms_to_frames(probes_ms + MIN_SIL_MS)
+    rms = np.sqrt((cumulative[hi] - cumulative[lo]) / ((hi - lo) * audio.shape[1]))
+    silent = 20 * np.log10(rms + 1e-12) < SILENCE_THRESH  # float samples: full scale is 1.0
+    run_start = silent.copy()
+    run_start[1:] &= ~silent[:-1]
+    return probes_ms[run_start]
+
+
 def slice_audio(in_path: Path, out_dir: Path):
-    audio = AudioSegment.from_file(in_path)
+    # Decode once; every fragment is a slice of this array
+    audio, sr = sf.read(in_path, dtype="float32", always_2d=True)
 
     # 1) Resample if necessary
-    if audio.frame_rate != TARGET_SR:
-        audio = audio.set_frame_rate(TARGET_SR)
+    if sr != TARGET_SR:
+        audio = librosa.resample(audio.T, orig_sr=sr, target_sr=TARGET_SR).T
+
+    pauses = find_pauses(audio)
+    total_ms = len(audio) * 1000 // TARGET_SR
 
     out_dir.mkdir(parents=True, exist_ok=True)
     cursor_ms = 0
     idx = 0
 
-    while cursor_ms < len(audio):
+    while cursor_ms < total_ms:
         # Window that never exceeds MAX_LEN
-        win_end = min(cursor_ms + MAX_LEN, len(audio))
-        window = audio[cursor_ms:win_end]
-
-        # Search for silences within the window
-        silences = silence.detect_silence(
-            window,
-            min_silence_len=MIN_SIL_MS,
-            silence_thresh=SILENCE_THRESH,
-            seek_step=10        # ms, finer → more precise, slower
-        )
-
-        # Choose the FIRST silence after MIN_LEN
-        cut_ms = None
-        for s_start, _ in silences:
-            if s_start >= MIN_LEN:
-                cut_ms = cursor_ms + s_start
-                break
-
-        # If no appropriate silence, cut hard at MAX_LEN
-        if cut_ms is None:
+        win_end = min(cursor_ms + MAX_LEN, total_ms)
+
+        # Choose the FIRST silence after MIN_LEN that fits inside the window
+        i = np.searchsorted(pauses, cursor_ms + MIN_LEN)
+        if i < len(pauses) and pauses[i] + MIN_SIL_MS <= win_end:
+            cut_ms = int(pauses[i])
+        else:
+            # If no appropriate silence, cut hard at MAX_LEN
             cut_ms = win_end
 
-        # Export fragment
-        chunk = audio[cursor_ms:cut_ms]
+        # Export fragment (the last one keeps the sub-millisecond tail)
+        end = len(audio) if cut_ms == total_ms else ms_to_frames(cut_ms)
+        chunk = audio[ms_to_frames(cursor_ms):end]
         chunk_path = out_dir / f"chunk_{idx:03d}.wav"
-        chunk.export(chunk_path, format="wav")
-        print(f"· Saved {chunk_path} ({len(chunk)/1000:.2f} s)")
+        sf.write(chunk_path, chunk, TARGET_SR, subtype="PCM_16")
+        print(f"· Saved {chunk_path} ({len(chunk)/TARGET_SR:.2f} s)")
 
         idx += 1
         cursor_ms = cut_ms   # Advance to next fragment
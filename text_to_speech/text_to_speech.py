@@ -8,10 +8,17 @@ An XTTS wrapper that **accepts a local model directory** (via env-vars
 * Saves 16-bit PCM WAV using the model's native sample rate
 """
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 from io import BytesIO
 import logging
+import os
 from pathlib import Path
-from typing import List
+import threading
+from time import perf_counter
+from typing import Iterator, List
 import re
 
 import numpy as np
@@ -21,6 +28,7 @@ from TTS.tts.configs.xtts_config import XttsConfig
 from TTS.tts.models.xtts import Xtts
 from TTS.tts.layers.xtts.tokenizer import VoiceBpeTokenizer
 from huggingface_hub import hf_hub_download
+from utils.utils import get_env_var
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -30,10 +38,30 @@ logger.setLevel(logging.DEBUG)
 XTTS_MODEL_DIR = Path("text_to_speech/model").expanduser()
 XTTS_TOKENIZER_PATH = Path("text_to_speech/model/vocab.json").expanduser()
 XTTS_SPEAKER_WAV = Path("text_to_speech/speaker_clone.wav").expanduser()
+XTTS_SPEAKER_CACHE = XTTS_MODEL_DIR / "speaker_cache.pt"  # conditioning latents of XTTS_SPEAKER_WAV
 
 MAX_CHUNK_LENGTH = 200  # characters
+_SENTENCE_RE = re.compile(r'\S[^.!?]*(?:[.!?]+|$)')  # one sentence with its closing punctuation
+WARMUP_TEXT = "Hola."  # synthesized once at startup so the first request doesn't pay the cold start
+CHUNK_GAP_SEC = 0.02    # silence between chunks
+CHUNK_FADE_SEC = 0.002  # Hann ramp on both edges of every chunk, hides boundary clicks
+PREFETCH_WORKERS = 4    # threads synthesizing the next chunk of in-flight requests
+
+# Intra-op threads for CPU inference (GEMM-bound); ignored once the model is on GPU
+TTS_THREADS = int(get_env_var("TTS_THREADS", os.cpu_count() or 4))
+# "int8" swaps nn.Linear layers for dynamically quantized ones (CPU inference only)
+TTS_QUANT = get_env_var("TTS_QUANT", "")
+# "fp16"/"bf16" run the forward pass under CUDA autocast, weights stay fp32 (GPU inference only)
+XTTS_PRECISION = get_env_var("XTTS_PRECISION", "fp32").lower()
+AUTOCAST_DTYPES = {"fp16": torch.float16, "bf16": torch.bfloat16}
+# Set to use DeepSpeed's fused inference kernels for the GPT decode loop (`pip install deepspeed`, GPU only)
+XTTS_DEEPSPEED = bool(get_env_var("XTTS_DEEPSPEED", ""))
+# Budget for the LRU of synthesized chunks, so stock phrases skip the model (0 disables it)
+TTS_CACHE_MB = float(get_env_var("TTS_CACHE_MB", "256"))
 # -----------------------------------------------------------------------------
 
+torch.set_num_threads(TTS_THREADS)
+
 class TextToAudio:
     """Turn Spanish commentary into 16-bit PCM WAV bytes using XTTS."""
 
@@ -41,6 +69,17 @@ class TextToAudio:
         # voice parameter kept for interface compatibility but not used in XTTS
         self.voice = voice
         self.sample_rate = sample_rate  # Will be overridden by model's native rate
+        # XTTS is not thread-safe: only the forward pass is serialized, chunking and encoding overlap
+        self._model_lock = threading.Lock()
+        # chunk text -> read-only float32 audio, most recently used last
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._cache_bytes = 0
+        self._cache_limit = int(TTS_CACHE_MB * 1024 * 1024)
+        self._cache_lock = threading.Lock()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        # Chunk N+1 is synthesized here while chunk N is encoded and forwarded
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="tts-prefetch")
         
         # Load XTTS model
         self._load_model()
@@ -48,6 +87,20 @@ class TextToAudio:
         # Update sample rate from model config
         self.sample_rate = self.config.audio.output_sample_rate
         logger.info("📦 XTTS model loaded with sample rate: %d Hz", self.sample_rate)
+        self._gap_len = int(CHUNK_GAP_SEC * self.sample_rate)
+        fade_len = int(CHUNK_FADE_SEC * self.sample_rate)
+        self._fade_in = np.hanning(2 * fade_len)[:fade_len].astype(np.float32)
+
+        self._warmup()
+
+    def _warmup(self):
+        """Run one synthesis so CUDA kernels and allocator caches are ready."""
+        start = perf_counter()
+        try:
+            self._collect(WARMUP_TEXT)
+            logger.info("🔥 XTTS warmed up in %.2f s", perf_counter() - start)
+        except Exception:
+            logger.exception("❌ XTTS warmup failed")
 
     def _load_model(self):
         """Load the XTTS model and configuration."""
@@ -85,7 +138,8 @@ class TextToAudio:
                 raise RuntimeError(f"Failed to download model from HuggingFace: {e}")
 
 
-        self.model.load_checkpoint(self.config, checkpoint_dir=str(XTTS_MODEL_DIR), eval=True)
+        self.model.load_checkpoint(self.config, checkpoint_dir=str(XTTS_MODEL_DIR), eval=True,
+                                   use_deepspeed=self._use_deepspeed())
         
         # Reinitialize tokenizer after loading checkpoint
         self.model.tokenizer = VoiceBpeTokenizer(self.config.model_args.tokenizer_file)
@@ -93,11 +147,93 @@ class TextToAudio:
         # Send to GPU and eval mode
         if torch.cuda.is_available():
             self.model.cuda()
+            # Let cuDNN time its conv algorithms once and keep the fastest for the vocoder shapes
+            torch.backends.cudnn.benchmark = True
         self.model.eval()
+
+        if TTS_QUANT == "int8":
+            if torch.cuda.is_available():
+                logger.warning("⚠️  TTS_QUANT=int8 only applies to CPU inference, keeping float weights on GPU")
+            else:
+                self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+                logger.info("📦 Quantized XTTS Linear layers to int8")
+        elif TTS_QUANT:
+            logger.warning("⚠️  Unsupported TTS_QUANT=%s, keeping float weights", TTS_QUANT)
+
+        self._autocast = nullcontext
+        if XTTS_PRECISION in AUTOCAST_DTYPES:
+            if not torch.cuda.is_available():
+                logger.warning("⚠️  XTTS_PRECISION=%s only applies to GPU inference, keeping fp32", XTTS_PRECISION)
+            elif XTTS_PRECISION == "bf16" and not torch.cuda.is_bf16_supported():
+                logger.warning("⚠️  This GPU has no bf16 support, keeping fp32")
+            else:
+                self._autocast = partial(torch.autocast, "cuda", dtype=AUTOCAST_DTYPES[XTTS_PRECISION])
+                logger.info("📦 XTTS forward pass under %s autocast", XTTS_PRECISION)
+        elif XTTS_PRECISION != "fp32":
+            logger.warning("⚠️  Unsupported XTTS_PRECISION=%s, keeping fp32", XTTS_PRECISION)
         
         logger.info("📦 Loaded XTTS from %s", XTTS_MODEL_DIR)
+
+        # The reference voice never changes: encode it once instead of on every synthesize() call
+        self.gpt_cond_latent, self.speaker_embedding = self._speaker_latents()
+        # Sampling settings synthesize() would have taken from the config
+        self._inference_kwargs = {
+            "temperature": self.config.temperature,
+            "length_penalty": self.config.length_penalty,
+            "repetition_penalty": self.config.repetition_penalty,
+            "top_k": self.config.top_k,
+            "top_p": self.config.top_p,
+        }
         logger.info("🎤 Using speaker reference: %s", XTTS_SPEAKER_WAV)
 
+    def _speaker_latents(self):
+        """Conditioning latents for XTTS_SPEAKER_WAV, from the on-disk cache while it is still current."""
+        device = next(self.model.parameters()).device
+        sources = (XTTS_SPEAKER_WAV, XTTS_MODEL_DIR / "model.pth")
+        # Latents depend on the reference wav and on the weights (quantized ones included)
+        if XTTS_SPEAKER_CACHE.exists() and all(
+            XTTS_SPEAKER_CACHE.stat().st_mtime > path.stat().st_mtime for path in sources
+        ):
+            try:
+                cached = torch.load(XTTS_SPEAKER_CACHE, map_location=device)
+                if cached["quant"] == TTS_QUANT:
+                    logger.info("🎤 Loaded speaker latents from %s", XTTS_SPEAKER_CACHE)
+                    return cached["gpt_cond_latent"], cached["speaker_embedding"]
+            except Exception as e:
+                logger.warning("⚠️  Ignoring unreadable speaker cache %s: %s", XTTS_SPEAKER_CACHE, e)
+
+        with torch.inference_mode():
+            gpt_cond_latent, speaker_embedding = self.model.get_conditioning_latents(
+                audio_path=str(XTTS_SPEAKER_WAV),
+                gpt_cond_len=3,
+                max_ref_length=10,
+            )
+        try:
+            torch.save({
+                "quant": TTS_QUANT,
+                "gpt_cond_latent": gpt_cond_latent.cpu(),
+                "speaker_embedding": speaker_embedding.cpu(),
+            }, XTTS_SPEAKER_CACHE)
+        except OSError as e:
+            logger.warning("⚠️  Could not write speaker cache %s: %s", XTTS_SPEAKER_CACHE, e)
+        return gpt_cond_latent, speaker_embedding
+
+    @staticmethod
+    def _use_deepspeed() -> bool:
+        """Whether XTTS_DEEPSPEED is set and can actually be honoured here."""
+        if not XTTS_DEEPSPEED:
+            return False
+        if not torch.cuda.is_available():
+            logger.warning("⚠️  XTTS_DEEPSPEED only applies to GPU inference, using the eager GPT")
+            return False
+        try:
+            import deepspeed  # noqa: F401
+        except ImportError:
+            logger.warning("⚠️  XTTS_DEEPSPEED is set but the deepspeed package is not installed, using the eager GPT")
+            return False
+        logger.info("📦 XTTS GPT decoding through DeepSpeed inference kernels")
+        return True
+
     def _chunk_text(self, text: str) -> List[str]:
         """Split text into chunks suitable for XTTS processing."""
         # Clean and normalize text
@@ -109,51 +245,40 @@ class TextToAudio:
         if len(text) <= MAX_CHUNK_LENGTH:
             return [text]
         
-        chunks = []
-        
-        # Split by sentences first (period, exclamation, question mark)
-        sentences = re.split(r'([.!?]+)', text)
-        
-        current_chunk = ""
-        for i in range(0, len(sentences), 2):  # Process sentence + punctuation pairs
-            sentence = sentences[i].strip()
-            punct = sentences[i + 1] if i + 1 < len(sentences) else ""
-            
-            if not sentence:
-                continue
-                
-            full_sentence = sentence + punct
-            
-            # If adding this sentence would exceed max length, save current chunk
-            if current_chunk and len(current_chunk) + len(full_sentence) > MAX_CHUNK_LENGTH:
-                chunks.append(current_chunk.strip())
-                current_chunk = full_sentence
-            else:
-                current_chunk += (" " if current_chunk else "") + full_sentence
+        # Single spaces only, so chunks are plain slices of the text and the span math below is exact
+        text = " ".join(text.split())
         
-        # Add remaining chunk
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
+        chunks = []
+        start = end = None
+        # Greedily pack sentence spans, emitting each chunk as a single slice
+        for match in _SENTENCE_RE.finditer(text):
+            if start is None:
+                start = match.start()
+            elif match.end() - start > MAX_CHUNK_LENGTH:
+                chunks.extend(self._split_words(text[start:end]))
+                start = match.start()
+            end = match.end()
+        if start is not None:
+            chunks.extend(self._split_words(text[start:end]))
         
-        # If we still have chunks that are too long, split them further
-        final_chunks = []
-        for chunk in chunks:
-            if len(chunk) <= MAX_CHUNK_LENGTH:
-                final_chunks.append(chunk)
-            else:
-                # Split by commas or spaces as last resort
-                words = chunk.split()
-                temp_chunk = ""
-                for word in words:
-                    if temp_chunk and len(temp_chunk) + len(word) + 1 > MAX_CHUNK_LENGTH:
-                        final_chunks.append(temp_chunk.strip())
-                        temp_chunk = word
-                    else:
-                        temp_chunk += (" " if temp_chunk else "") + word
-                if temp_chunk.strip():
-                    final_chunks.append(temp_chunk.strip())
-        
-        return final_chunks
+        return chunks
+
+    @staticmethod
+    def _split_words(chunk: str) -> List[str]:
+        """Split a chunk longer than MAX_CHUNK_LENGTH at the last space that fits (words are never cut)."""
+        pieces = []
+        start = 0
+        while len(chunk) - start > MAX_CHUNK_LENGTH:
+            cut = chunk.rfind(" ", start, start + MAX_CHUNK_LENGTH + 1)
+            if cut <= start:
+                # A single word longer than the limit goes out whole
+                cut = chunk.find(" ", start + MAX_CHUNK_LENGTH)
+                if cut == -1:
+                    break
+            pieces.append(chunk[start:cut])
+            start = cut + 1
+        pieces.append(chunk[start:])
+        return pieces
 
     @staticmethod
     def _to_np(audio_tensor):
@@ -164,24 +289,84 @@ class TextToAudio:
             return audio_tensor.astype(np.float32, copy=False)
         raise TypeError(f"Unexpected audio type: {type(audio_tensor)}")
 
+    def _cache_get(self, text: str):
+        with self._cache_lock:
+            audio = self._cache.get(text)
+            if audio is None:
+                self._cache_misses += 1
+                return None
+            self._cache.move_to_end(text)
+            self._cache_hits += 1
+            logger.debug("🗃️  Chunk cache hit (%d hits / %d misses)", self._cache_hits, self._cache_misses)
+            return audio
+
+    def _cache_put(self, text: str, audio: np.ndarray) -> None:
+        if audio.nbytes > self._cache_limit:
+            return
+        audio.setflags(write=False)  # shared between requests
+        with self._cache_lock:
+            previous = self._cache.pop(text, None)
+            if previous is not None:
+                self._cache_bytes -= previous.nbytes
+            self._cache[text] = audio
+            self._cache_bytes += audio.nbytes
+            while self._cache_bytes > self._cache_limit:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= evicted.nbytes
+
     def _synthesize_chunk(self, text: str) -> np.ndarray:
-        """Synthesize a single text chunk using XTTS."""
+        """Synthesize a single text chunk using XTTS, reusing the audio of chunks already heard."""
+        audio = self._cache_get(text)
+        if audio is not None:
+            return audio
         try:
-            output = self.model.synthesize(
-                text,
-                self.config,
-                speaker_wav=XTTS_SPEAKER_WAV,
-                gpt_cond_len=3,
-                language="es",
-            )
+            # Inference mode is thread-local, so it is entered here on whichever thread runs the chunk
+            with self._model_lock, torch.inference_mode(), self._autocast():
+                output = self.model.inference(
+                    text,
+                    "es",
+                    self.gpt_cond_latent,
+                    self.speaker_embedding,
+                    **self._inference_kwargs,
+                )
             
             wav = output["wav"]
-            return self._to_np(wav)
+            audio = self._to_np(wav)
             
         except Exception as e:
             logger.error("❌ Error synthesizing chunk '%s': %s", text[:50], str(e))
-            # Return silence as fallback
+            # Return silence as fallback (never cached)
             return np.zeros(int(0.5 * self.sample_rate), dtype=np.float32)
+        
+        self._cache_put(text, audio)
+        return audio
+
+    def _fade_into(self, out: np.ndarray, audio: np.ndarray) -> None:
+        """Copy the chunk into the start of ``out`` with faded edges; the rest of ``out`` is left as is."""
+        n = audio.shape[0]
+        out[:n] = audio
+        fade = min(self._fade_in.shape[0], n // 2)
+        if fade:
+            out[:fade] *= self._fade_in[:fade]
+            out[n - fade:n] *= self._fade_in[:fade][::-1]
+
+    def _iter_raw(self, chunks: List[str]) -> Iterator[np.ndarray]:
+        """Synthesize one chunk ahead, yielding the model audio of each chunk in order."""
+        ahead = self._prefetch_pool.submit(self._synthesize_chunk, chunks[0])
+        for idx, chunk in enumerate(chunks):
+            logger.debug("    chunk %-2d: %s", idx, chunk[:50] + "..." if len(chunk) > 50 else chunk)
+            audio = ahead.result()
+            if idx < len(chunks) - 1:
+                ahead = self._prefetch_pool.submit(self._synthesize_chunk, chunks[idx + 1])
+            yield audio
+
+    def _iter_audio(self, chunks: List[str]) -> Iterator[np.ndarray]:
+        """Yield each clip with faded edges and the short gap after every chunk but the last."""
+        last = len(chunks) - 1
+        for idx, audio in enumerate(self._iter_raw(chunks)):
+            out = np.zeros(audio.shape[0] + (self._gap_len if idx < last else 0), dtype=np.float32)
+            self._fade_into(out, audio)
+            yield out
 
     def _collect(self, text: str) -> np.ndarray:
         """Process text in chunks and collect audio."""
@@ -191,23 +376,18 @@ class TextToAudio:
             logger.warning("⚠️  No text chunks to process")
             return np.empty(0, np.float32)
         
-        audio_chunks: List[np.ndarray] = []
-        
-        for idx, chunk in enumerate(chunks):
-            logger.debug("    chunk %-2d: %s", idx, chunk[:50] + "..." if len(chunk) > 50 else chunk)
-            
-            audio = self._synthesize_chunk(chunk)
-            audio_chunks.append(audio)
-            
-            # Add small pause between chunks (100ms)
-            if idx < len(chunks) - 1:  # Don't add pause after last chunk
-                pause = np.zeros(int(0.1 * self.sample_rate), dtype=np.float32)
-                audio_chunks.append(pause)
-        
-        return np.concatenate(audio_chunks) if audio_chunks else np.empty(0, np.float32)
+        # One zeroed buffer for the whole take: chunks are faded straight into it and the gaps need no arrays
+        audio_chunks = list(self._iter_raw(chunks))
+        total = sum(a.shape[0] for a in audio_chunks) + self._gap_len * (len(audio_chunks) - 1)
+        out = np.zeros(total, dtype=np.float32)
+        offset = 0
+        for audio in audio_chunks:
+            self._fade_into(out[offset:], audio)
+            offset += audio.shape[0] + self._gap_len
+        return out
 
-    def process(self, request) -> bytes:
-        """Process text request and return WAV bytes."""
+    @staticmethod
+    def _prepare_text(request) -> str:
         text = request.text if hasattr(request, "text") else str(request)
         
         # Clean text
@@ -218,24 +398,68 @@ class TextToAudio:
         # Ensure text ends with punctuation for better synthesis
         if not text.endswith((".", "!", "?", "\n")):
             text += "."
+        return text
+
+    @staticmethod
+    def _to_pcm16(audio: np.ndarray) -> np.ndarray:
+        """Float audio to int16 samples with vectorized ufuncs, rounding like libsndfile but clipping instead of wrapping."""
+        pcm = np.clip(audio, -1.0, 1.0)
+        np.multiply(pcm, 32767, out=pcm)
+        np.rint(pcm, out=pcm)
+        return pcm.astype(np.int16)
+
+    def _to_wav(self, audio: np.ndarray) -> bytes:
+        """Encode float audio as 16-bit PCM WAV bytes."""
+        buf = BytesIO()
+        # int16 input is written as is, libsndfile does no sample conversion
+        sf.write(buf, self._to_pcm16(audio), self.sample_rate, format="WAV", subtype="PCM_16")
+        return buf.getvalue()
+
+    def process(self, request) -> bytes:
+        """Process text request and return WAV bytes."""
+        text = self._prepare_text(request)
+        chunks = self._chunk_text(text)
+        if not chunks:
+            logger.warning("⚠️  No text chunks to process")
+            raise RuntimeError("XTTS produced no audio")
         
         logger.info("🗣️  Synthesising | %s…", text[:70])
         
-        audio = self._collect(text)
+        # Encode each chunk into the 16-bit PCM WAV as it comes out, instead of concatenating the whole take first
+        buf = BytesIO()
+        total_samples = 0
+        with sf.SoundFile(buf, mode="w", samplerate=self.sample_rate, channels=1,
+                          format="WAV", subtype="PCM_16") as wav:
+            for audio in self._iter_audio(chunks):
+                wav.write(self._to_pcm16(audio))
+                total_samples += audio.shape[0]
         
-        if audio.size == 0:
+        if total_samples == 0:
             raise RuntimeError("XTTS produced no audio")
         
         # Check if audio is too short (likely a problem)
         min_duration = 0.1  # 100ms minimum
-        if audio.shape[0] < min_duration * self.sample_rate:
+        if total_samples < min_duration * self.sample_rate:
             logger.warning("⚠️  Very short audio output (%.0f ms). This might indicate a problem.",
-                           1000 * audio.shape[0] / self.sample_rate)
+                           1000 * total_samples / self.sample_rate)
         
-        duration = audio.shape[0] / self.sample_rate
-        logger.info("✅ Final audio %.2f s (%d samples)", duration, audio.shape[0])
+        duration = total_samples / self.sample_rate
+        logger.info("✅ Final audio %.2f s (%d samples)", duration, total_samples)
         
-        # Convert to 16-bit PCM WAV
-        buf = BytesIO()
-        sf.write(buf, audio, self.sample_rate, format="WAV", subtype="PCM_16")
-        return buf.getvalue()
\ No newline at end of file
+        return buf.getvalue()
+
+    def iter_process(self, request) -> Iterator[bytes]:
+        """Yield one WAV clip per text chunk as soon as it is synthesized.
+
+        Same audio as process(), including the gap after every chunk but the
+        last, so the first clip can play while the rest is generated.
+        """
+        text = self._prepare_text(request)
+        chunks = self._chunk_text(text)
+        if not chunks:
+            raise RuntimeError("XTTS produced no audio")
+
+        logger.info("🗣️  Synthesising %d chunk(s) | %s…", len(chunks), text[:70])
+        for idx, audio in enumerate(self._iter_audio(chunks)):
+            logger.info("✅ Chunk %d/%d audio %.2f s", idx + 1, len(chunks), audio.shape[0] / self.sample_rate)
+            yield self._to_wav(audio)
@@ -3,11 +3,14 @@ import json
 import torch
 import gc
 import warnings
-import torchaudio
+import numpy as np
+import soundfile as sf
+from concurrent.futures import ThreadPoolExecutor
+from torch.utils.data import DataLoader
 
 from trainer import Trainer, TrainerArgs
 
-from huggingface_hub import snapshot_download
+from huggingface_hub import hf_hub_download, snapshot_download
 import subprocess
 
 from TTS.config.shared_configs import BaseDatasetConfig
@@ -32,6 +35,12 @@ OPTIMIZER_WD_ONLY_ON_WEIGHTS = True
 START_WITH_EVAL = False
 BATCH_SIZE = 1
 GRAD_ACUMM_STEPS = 32
+# Opt-in speedups: fp16 AMP can bring back the NaN losses this run guards against, so both stay off by default
+MIXED_PRECISION = False
+COMPILE_GPT = False
+LOADER_PREFETCH_FACTOR = 4
+VALIDATE_WORKERS = min(16, os.cpu_count() or 4)  # audio checks are I/O bound
+FLOAT_SUBTYPES = {"FLOAT", "DOUBLE"}  # the only sample formats that can hold NaN/Inf
 
 config_dataset = BaseDatasetConfig(
     formatter="ljspeech",
@@ -84,13 +93,18 @@ MEL_NORM_FILE = os.path.join(PRETRAINED_MODEL_PATH, "mel_stats.pth")
 if not os.path.isfile(DVAE_CHECKPOINT) or not os.path.isfile(MEL_NORM_FILE):
     print("DVAE checkpoint or mel norm file not found. Downloading...")
     # coqui/XTTS-v2 'dvae.pth and mel_stats.pth are available in the same repo
-    dvae_url = "https://huggingface.co/coqui/XTTS-v2/resolve/main/dvae.pth"
-    mel_norm_url = "https://huggingface.co/coqui/XTTS-v2/resolve/main/mel_stats.pth"
-    os.makedirs(os.path.dirname(DVAE_CHECKPOINT), exist_ok=True)
-    os.makedirs(os.path.dirname(MEL_NORM_FILE), exist_ok=True)
+    missing = [path for path in (DVAE_CHECKPOINT, MEL_NORM_FILE) if not os.path.isfile(path)]
     try:
-        subprocess.check_call(["wget", dvae_url, "-O", DVAE_CHECKPOINT])
-        subprocess.check_call(["wget", mel_norm_url, "-O", MEL_NORM_FILE])
+        # Fetched concurrently, with resume and checksum verification from the hub client
+        with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+            list(pool.map(
+                lambda path: hf_hub_download(
+                    repo_id="coqui/XTTS-v2",
+                    filename=os.path.basename(path),
+                    local_dir=os.path.dirname(path),
+                ),
+                missing,
+            ))
     except Exception as e:
         print(f"Error downloading files: {e}")
         raise 
@@ -111,54 +125,130 @@ SPEAKER_REFERENCE = [
 ]
 LANGUAGE = config_dataset.language
 
-def validate_audio_files(samples):
-    valid_samples = []
-    for sample in samples:
+def _validate_one(sample):
+    """Return the sample if its audio and text pass the checks, else None."""
+    try:
+        audio_file = sample.get('audio_file', '')
+        
+        if not os.path.exists(audio_file):
+            print(f"Warning: Audio file not found: {audio_file}")
+            return None
+        
+        if 'copy' in os.path.basename(audio_file).lower():
+            print(f"Warning: Skipping copy file (likely corrupted): {audio_file}")
+            return None
+        
+        # Header only: duration and frame count don't need the samples
         try:
-            audio_file = sample.get('audio_file', '')
-            
-            if not os.path.exists(audio_file):
-                print(f"Warning: Audio file not found: {audio_file}")
-                continue
-            
-            if 'copy' in os.path.basename(audio_file).lower():
-                print(f"Warning: Skipping copy file (likely corrupted): {audio_file}")
-                continue
-            
+            info = sf.info(audio_file)
+        except Exception as e:
+            print(f"Warning: Cannot load audio file {audio_file}: {e}")
+            return None
+        sr, frames = info.samplerate, info.frames
+        
+        duration = frames / sr
+        if duration < 1.0 or duration > 15.0:
+            print(f"Warning: Audio duration {duration:.2f}s outside range: {audio_file}")
+            return None
+        
+        if frames < sr * 0.5:
+            print(f"Warning: Audio too short ({frames} samples): {audio_file}")
+            return None
+        
+        # Integer PCM cannot encode NaN/Inf, so only float files are decoded for the check
+        if info.subtype in FLOAT_SUBTYPES:
             try:
-                waveform, sr = torchaudio.load(audio_file)
+                waveform, _ = sf.read(audio_file, dtype="float32")
             except Exception as e:
                 print(f"Warning: Cannot load audio file {audio_file}: {e}")
-                continue
-            
-            if torch.isnan(waveform).any() or torch.isinf(waveform).any():
+                return None
+            if not np.isfinite(waveform).all():
                 print(f"Warning: Audio contains NaN/Inf values: {audio_file}")
-                continue
+                return None
+        
+        text = sample.get('text', '').strip()
+        if len(text) < 5 or len(text) > 500:
+            print(f"Warning: Text length {len(text)} outside range: {text[:50]}...")
+            return None
+        
+        return sample
+        
+    except Exception as e:
+        print(f"Error processing {sample.get('audio_file', 'unknown')}: {e}")
+        return None
+
+
+def validate_audio_files(samples):
+    with ThreadPoolExecutor(max_workers=VALIDATE_WORKERS) as pool:
+        valid_samples = [sample for sample in pool.map(_validate_one, samples) if sample is not None]
+    
+    print(f"Validated {len(valid_samples)} out of {len(samples)} samples")
+    return valid_samples
+
+class _BatchFixerLoader:
+    """Fill in batch keys the GPT trainer expects but the dataset does not produce."""
+
+    def __init__(self, original_loader):
+        self.original_loader = original_loader
+    
+    def __iter__(self):
+        for batch in self.original_loader:
+            if 'conditioning' in batch and 'cond_mels' not in batch:
+                batch['cond_mels'] = batch['conditioning']
             
-            duration = waveform.shape[1] / sr
-            if duration < 1.0 or duration > 15.0:
-                print(f"Warning: Audio duration {duration:.2f}s outside range: {audio_file}")
-                continue
+            if 'text_inputs' not in batch and 'padded_text' in batch:
+                batch['text_inputs'] = batch['padded_text']
             
-            if waveform.shape[1] < sr * 0.5:
-                print(f"Warning: Audio too short ({waveform.shape[1]} samples): {audio_file}")
-                continue
+            if 'wav_lengths' not in batch and 'wav' in batch:
+                wav_tensor = batch['wav']
+                if wav_tensor.dim() in (2, 3):
+                    # Batches are padded, so every length is the last dimension
+                    batch['wav_lengths'] = torch.full((wav_tensor.shape[0],), wav_tensor.shape[-1], dtype=torch.long)
             
-            text = sample.get('text', '').strip()
-            if len(text) < 5 or len(text) > 500:
-                print(f"Warning: Text length {len(text)} outside range: {text[:50]}...")
-                continue
+            if 'text_lengths' not in batch and 'padded_text' in batch:
+                text_tensor = batch['padded_text']
+                batch['text_lengths'] = (text_tensor != 0).sum(dim=1)
             
-            valid_samples.append(sample)
+            # Start the host-to-device copy of pinned tensors now, so it overlaps fetching the next batch
+            for key, value in batch.items():
+                if torch.is_tensor(value) and value.is_pinned():
+                    batch[key] = value.to("cuda", non_blocking=True)
             
-        except Exception as e:
-            print(f"Error processing {sample.get('audio_file', 'unknown')}: {e}")
-            continue
+            yield batch
     
-    print(f"Validated {len(valid_samples)} out of {len(samples)} samples")
-    return valid_samples
+    def __len__(self):
+        return len(self.original_loader)
+
+
+def _persistent_loader(loader):
+    """Rebuild the trainer's DataLoader with pinned batches and workers that survive across epochs."""
+    if loader.num_workers == 0 or not torch.cuda.is_available():
+        return loader
+    return DataLoader(
+        loader.dataset,
+        batch_sampler=loader.batch_sampler,
+        collate_fn=loader.collate_fn,
+        num_workers=loader.num_workers,
+        pin_memory=True,
+        persistent_workers=True,
+        prefetch_factor=LOADER_PREFETCH_FACTOR,
+    )
+
+
+def _fix_batches(get_dataloader):
+    # The trainer asks for a new loader every epoch; the samples never change here, so reuse
+    # the first one and keep its workers alive instead of respawning them
+    loaders = []
+    def patched_get_dataloader(*args, **kwargs):
+        if not loaders:
+            loaders.append(_BatchFixerLoader(_persistent_loader(get_dataloader(*args, **kwargs))))
+        return loaders[0]
+    return patched_get_dataloader
+
 
 def main():
+    # TF32 matmuls keep the fp32 range, so they are safe even without AMP
+    torch.set_float32_matmul_precision("high")
     torch.cuda.empty_cache()
     gc.collect()
     
@@ -238,7 +328,7 @@ def main():
         },
         
         grad_clip=1.0,
-        mixed_precision=False,
+        mixed_precision=MIXED_PRECISION,
         
         test_sentences=[
             {
@@ -253,52 +343,48 @@ def main():
     gc.collect()
 
     model = GPTTrainer.init_from_config(config)
-    
-    total_params = sum(p.numel() for p in model.parameters())
-    trainable_params = sum(p.numel() for p in model.parameters() if p.requires_grad)
-    print(f"Initial - Total: {total_params:,}, Trainable: {trainable_params:,}")
-    
-    for param in model.dvae.parameters():
-        param.requires_grad = False
-    
-    if hasattr(model, 'torch_mel_spectrogram_style_encoder'):
-        for param in model.torch_mel_spectrogram_style_encoder.parameters():
-            param.requires_grad = False
-    
-    if hasattr(model, 'torch_mel_spectrogram_dvae'):
-        for param in model.torch_mel_spectrogram_dvae.parameters():
-            param.requires_grad = False
+    if COMPILE_GPT:
+        # In place, so checkpoint keys keep their names; dynamic since text/audio lengths vary per batch
+        model.xtts.gpt.compile(dynamic=True)
     
     gpt_model = model.xtts.gpt
     
-    if hasattr(gpt_model, 'text_embedding'):
-        gpt_model.text_embedding.requires_grad_(False)
-    if hasattr(gpt_model, 'mel_embedding'):
-        gpt_model.mel_embedding.requires_grad_(False)
-    
+    # Everything but the top GPT layer is frozen: DVAE, mel front-ends, text/mel embeddings and the bottom layers
+    freeze_prefixes = (
+        'dvae.',
+        'torch_mel_spectrogram_style_encoder.',
+        'torch_mel_spectrogram_dvae.',
+        'xtts.gpt.text_embedding.',
+        'xtts.gpt.mel_embedding.',
+    )
     if hasattr(gpt_model, 'gpt') and hasattr(gpt_model.gpt, 'h'):
         total_layers = len(gpt_model.gpt.h)
         layers_to_freeze = max(0, total_layers - 1)
         print(f"Freezing bottom {layers_to_freeze} layers out of {total_layers}")
-        
-        for i in range(layers_to_freeze):
-            for param in gpt_model.gpt.h[i].parameters():
-                param.requires_grad = False
-    
-    trainable_params_final = sum(p.numel() for p in model.parameters() if p.requires_grad)
-    print(f"After freezing - Trainable: {trainable_params_final:,} ({trainable_params_final/total_params:.2%})")
+        freeze_prefixes += tuple(f'xtts.gpt.gpt.h.{i}.' for i in range(layers_to_freeze))
     
+    # One pass freezes, counts and checks the still-trainable weights for NaN/Inf
+    total_params = trainable_params = trainable_params_final = 0
     nan_params = []
     for name, param in model.named_parameters():
+        numel = param.numel()
+        total_params += numel
         if param.requires_grad:
-            if torch.isnan(param).any() or torch.isinf(param).any():
-                nan_params.append(name)
+            trainable_params += numel
+        if name.startswith(freeze_prefixes):
+            param.requires_grad = False
+        elif param.requires_grad:
+            trainable_params_final += numel
+            if not torch.isfinite(param).all():
+                nan_params.append((name, param))
+    
+    print(f"Initial - Total: {total_params:,}, Trainable: {trainable_params:,}")
+    print(f"After freezing - Trainable: {trainable_params_final:,} ({trainable_params_final/total_params:.2%})")
     
     if nan_params:
-        print(f"WARNING: Found NaN/Inf in parameters: {nan_params}")
-        for name, param in model.named_parameters():
-            if name in nan_params:
-                torch.nn.init.xavier_uniform_(param)
+        print(f"WARNING: Found NaN/Inf in parameters: {[name for name, _ in nan_params]}")
+        for _, param in nan_params:
+            torch.nn.init.xavier_uniform_(param)
     else:
         print("All parameters are finite - good!")
     
@@ -335,80 +421,10 @@ def main():
         eval_samples=eval_samples,
     )
     
-    original_get_train_dataloader = trainer.get_train_dataloader
-    
-    def patched_get_train_dataloader(*args, **kwargs):
-        loader = original_get_train_dataloader(*args, **kwargs)
-        
-        class BatchFixerLoader:
-            def __init__(self, original_loader):
-                self.original_loader = original_loader
-            
-            def __iter__(self):
-                for batch in self.original_loader:
-                    if 'conditioning' in batch and 'cond_mels' not in batch:
-                        batch['cond_mels'] = batch['conditioning']
-                    
-                    if 'text_inputs' not in batch and 'padded_text' in batch:
-                        batch['text_inputs'] = batch['padded_text']
-                    
-                    if 'wav_lengths' not in batch and 'wav' in batch:
-                        wav_tensor = batch['wav']
-                        if len(wav_tensor.shape) == 3:
-                            batch['wav_lengths'] = torch.tensor([wav_tensor.shape[2] for _ in range(wav_tensor.shape[0])], dtype=torch.long)
-                        elif len(wav_tensor.shape) == 2:
-                            batch['wav_lengths'] = torch.tensor([wav_tensor.shape[1] for _ in range(wav_tensor.shape[0])], dtype=torch.long)
-                    
-                    if 'text_lengths' not in batch and 'padded_text' in batch:
-                        text_tensor = batch['padded_text']
-                        batch['text_lengths'] = torch.sum(text_tensor != 0, dim=1)
-                    
-                    yield batch
-            
-            def __len__(self):
-                return len(self.original_loader)
-        
-        return BatchFixerLoader(loader)
-    
-    trainer.get_train_dataloader = patched_get_train_dataloader
-    
-    if hasattr(trainer, 'get_eval_dataloader'):
-        original_get_eval_dataloader = trainer.get_eval_dataloader
-        
-        def patched_get_eval_dataloader(*args, **kwargs):
-            loader = original_get_eval_dataloader(*args, **kwargs)
-            
-            class BatchFixerLoader:
-                def __init__(self, original_loader):
-                    self.original_loader = original_loader
-                
-                def __iter__(self):
-                    for batch in self.original_loader:
-                        if 'conditioning' in batch and 'cond_mels' not in batch:
-                            batch['cond_mels'] = batch['conditioning']
-                        
-                        if 'text_inputs' not in batch and 'padded_text' in batch:
-                            batch['text_inputs'] = batch['padded_text']
-                        
-                        if 'wav_lengths' not in batch and 'wav' in batch:
-                            wav_tensor = batch['wav']
-                            if len(wav_tensor.shape) == 3:
-                                batch['wav_lengths'] = torch.tensor([wav_tensor.shape[2] for _ in range(wav_tensor.shape[0])], dtype=torch.long)
-                            elif len(wav_tensor.shape) == 2:
-                                batch['wav_lengths'] = torch.tensor([wav_tensor.shape[1] for _ in range(wav_tensor.shape[0])], dtype=torch.long)
-                        
-                        if 'text_lengths' not in batch and 'padded_text' in batch:
-                            text_tensor = batch['padded_text']
-                            batch['text_lengths'] = torch.sum(text_tensor != 0, dim=1)
-                        
-                        yield batch
-                
-                def __len__(self):
-                    return len(self.original_loader)
-            
-            return BatchFixerLoader(loader)
-        
-        trainer.get_eval_dataloader = patched_get_eval_dataloader
+    # Wrap whichever dataloaders the trainer builds so every batch gets the keys GPTTrainer expects
+    for getter in ('get_train_dataloader', 'get_eval_dataloader'):
+        if hasattr(trainer, getter):
+            setattr(trainer, getter, _fix_batches(getattr(trainer, getter)))
     
     trainer.fit()
 
@@ -3,7 +3,12 @@ Discovery integration utilities
 Provides functions for service registration and discovery
 """
 
+import asyncio
+import functools
 import signal
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
 from discovery.client import get_service_endpoint, DiscoveryError, register_service, unregister_service
 import logging
 import socket
@@ -13,6 +18,20 @@ import grpc
 
 logger = logging.getLogger("Discovery Utils")
 
+# Optional shared endpoint cache: set DISCOVERY_REDIS_URL (and `pip install redis`)
+# so every process on the host reuses lookups instead of calling the discovery server
+DISCOVERY_REDIS_URL = get_env_var("DISCOVERY_REDIS_URL", None)
+DISCOVERY_CACHE_TTL = int(get_env_var("DISCOVERY_CACHE_TTL", "60"))
+
+# Options for the long-lived channels between modules: keep idle HTTP/2 connections
+# healthy so the next call doesn't pay a reconnect, and never route through a proxy
+GRPC_CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.enable_http_proxy", 0),
+]
+
 
 def start_grpc_server_with_discovery(
     server : grpc.server,
@@ -57,15 +76,153 @@ def start_grpc_server_with_discovery(
         # Cleanup and exit
         try:
             unregister_service(service_name)
+            invalidate_cached_endpoint(service_name)
         except:
             pass
         os._exit(1) 
 
 
+async def serve_grpc_aio_server_with_discovery(
+    server: grpc.aio.Server,
+    service_name: str,
+    host_address: str,
+    metadata: dict = None,
+    on_shutdown: Optional[Callable[[], Awaitable[None]]] = None
+):
+    """
+    Serve a grpc.aio server with automatic discovery registration and graceful shutdown
+    
+    Async counterpart of start_grpc_server_with_discovery: SIGINT/SIGTERM are handled
+    on the event loop, and the service is unregistered before the server stops.
+    
+    Args:
+        server: grpc.aio server instance
+        service_name: Name to register the service as
+        host_address: Host address in "host:port" format
+        metadata: Optional metadata for the service
+        on_shutdown: Optional coroutine function awaited after the server has stopped
+    """
+    loop = asyncio.get_running_loop()
+    
+    # Add server port
+    service_host = host_address.split(":")[0]
+    service_port = extract_port_from_host(host_address)
+    server.add_insecure_port(f"{service_host}:{service_port}")
+    
+    # Registration is a blocking HTTP call, keep it off the event loop
+    await loop.run_in_executor(None, functools.partial(
+        auto_register_service,
+        service_name=service_name,
+        service_host=service_host,
+        service_port=service_port,
+        metadata=metadata or {}
+    ))
+    
+    # Setup graceful shutdown
+    stop_requested = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_requested.set)
+    
+    # Start server
+    await server.start()
+    logger.info(f"📡 {service_name} gRPC server listening on {service_host}:{service_port}")
+    
+    termination = asyncio.ensure_future(server.wait_for_termination())
+    stop_signal = asyncio.ensure_future(stop_requested.wait())
+    await asyncio.wait({termination, stop_signal}, return_when=asyncio.FIRST_COMPLETED)
+    stop_signal.cancel()
+    logger.info("🛑 Received shutdown signal, stopping server...")
+    
+    # Unregister from discovery service
+    try:
+        await loop.run_in_executor(None, unregister_service, service_name)
+        await loop.run_in_executor(None, invalidate_cached_endpoint, service_name)
+        logger.info("✅ Unregistered from discovery service")
+    except Exception as e:
+        logger.error(f"❌ Failed to unregister from discovery service: {e}")
+    
+    # Stop the server gracefully
+    try:
+        await server.stop(grace=5)
+        logger.info("✅ Server stopped successfully")
+    except Exception as e:
+        logger.error(f"❌ Error stopping server: {e}")
+    
+    if on_shutdown is not None:
+        await on_shutdown()
+
+
+@functools.lru_cache(maxsize=1)
+def _get_redis():
+    """Connect to the shared endpoint cache, or return None if it isn't configured or available"""
+    if not DISCOVERY_REDIS_URL:
+        return None
+    try:
+        import redis
+    except ImportError:
+        logger.warning("⚠️ DISCOVERY_REDIS_URL is set but the redis package is not installed, caching locally only")
+        return None
+    return redis.Redis.from_url(DISCOVERY_REDIS_URL, socket_timeout=0.5, decode_responses=True)
+
+
+def _redis_key(service_name: str) -> str:
+    return f"discovery:{service_name}"
+
+
+# Per-process memo of discovery server answers: service_name -> (endpoint, expires_at)
+_endpoint_memo: Dict[str, Tuple[str, float]] = {}
+_refreshing = set()  # services with a background revalidation in flight
+_memo_lock = threading.Lock()
+
+
+def _discover_endpoint(service_name: str) -> str:
+    """Ask the discovery server, memoize the answer for DISCOVERY_CACHE_TTL and publish it to the shared cache"""
+    endpoint = get_service_endpoint(service_name)
+    with _memo_lock:
+        _endpoint_memo[service_name] = (endpoint, time.monotonic() + DISCOVERY_CACHE_TTL)
+    
+    cache = _get_redis()
+    if cache is not None:
+        key = _redis_key(service_name)
+        try:
+            cache.setex(key, DISCOVERY_CACHE_TTL, endpoint)
+            cache.set(f"{key}:last", endpoint)
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to update discovery cache: {e}")
+    
+    logger.debug(f"🔍 Found {service_name} via discovery: {endpoint}")
+    return endpoint
+
+
+def _revalidate(service_name: str):
+    try:
+        _discover_endpoint(service_name)
+    except DiscoveryError as e:
+        logger.warning(f"⚠️ Failed to revalidate {service_name}, keeping the stale endpoint: {e}")
+    finally:
+        with _memo_lock:
+            _refreshing.discard(service_name)
+
+
+def _revalidate_in_background(service_name: str):
+    """Refresh a stale endpoint without making the caller wait; at most one refresh per service"""
+    with _memo_lock:
+        if service_name in _refreshing:
+            return
+        _refreshing.add(service_name)
+    threading.Thread(target=_revalidate, args=(service_name,), name=f"discovery-{service_name}", daemon=True).start()
+
+
 def get_service_endpoint_from_discovery(service_name: str) -> str:
     """
     Get service endpoint using discovery service
     
+    Answers from the discovery server are memoized per process for DISCOVERY_CACHE_TTL
+    seconds and, when DISCOVERY_REDIS_URL is set, shared through Redis for as long.
+    Once an endpoint expires it is still returned while a background refresh asks the
+    discovery server again (stale-while-revalidate); only a service with no known
+    endpoint at all waits for the discovery server.
+    
     Args:
         service_name: Name of the service in discovery registry
     
@@ -75,9 +232,51 @@ def get_service_endpoint_from_discovery(service_name: str) -> str:
     Raises:
         DiscoveryError: If service discovery fails
     """
-    endpoint = get_service_endpoint(service_name)
-    logger.debug(f"🔍 Found {service_name} via discovery: {endpoint}")
-    return endpoint
+    with _memo_lock:
+        memo = _endpoint_memo.get(service_name)
+    if memo is not None:
+        endpoint, expires_at = memo
+        if time.monotonic() >= expires_at:
+            _revalidate_in_background(service_name)
+        return endpoint
+    
+    cache = _get_redis()
+    if cache is not None:
+        key = _redis_key(service_name)
+        try:
+            endpoint = cache.get(key)
+            if endpoint:
+                logger.debug(f"🔍 Found {service_name} in discovery cache: {endpoint}")
+                return endpoint
+            stale = cache.get(f"{key}:last")
+        except Exception as e:
+            logger.warning(f"⚠️ Discovery cache unavailable, querying discovery server: {e}")
+            stale = None
+        if stale:
+            logger.debug(f"🔍 Using last known endpoint for {service_name} while revalidating: {stale}")
+            _revalidate_in_background(service_name)
+            return stale
+    
+    return _discover_endpoint(service_name)
+
+
+def invalidate_cached_endpoint(service_name: str):
+    """
+    Drop a service's cached endpoint, locally and in the shared cache
+    
+    Args:
+        service_name: Name of the service in discovery registry
+    """
+    with _memo_lock:
+        _endpoint_memo.pop(service_name, None)
+    cache = _get_redis()
+    if cache is None:
+        return
+    key = _redis_key(service_name)
+    try:
+        cache.delete(key, f"{key}:last")
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to invalidate discovery cache for {service_name}: {e}")
 
 def auto_register_service(
     service_name: str,
@@ -157,6 +356,7 @@ def setup_graceful_shutdown(server, service_name: str = None):
         if service_name:
             try:
                 unregister_service(service_name)
+                invalidate_cached_endpoint(service_name)
                 logger.info("✅ Unregistered from discovery service")
             except Exception as e:
                 logger.error(f"❌ Failed to unregister from discovery service: {e}")
@@ -178,11 +378,14 @@ def setup_graceful_shutdown(server, service_name: str = None):
     return graceful_shutdown
 
 
+@functools.lru_cache(maxsize=1)
 def get_local_ip() -> str:
     """
     Get the local IP address for service registration.
     
     Uses SERVICE_HOST_IP environment variable if set, otherwise attempts basic IP detection.
+    The result is cached for the life of the process; call get_local_ip.cache_clear()
+    to force a re-detection.
     
     Returns:
         str: The IP address to use for service registration
@@ -193,7 +396,9 @@ def get_local_ip() -> str:
         logger.info(f"✍️ Overriding local_ip with env variable SERVICE_HOST_IP: {override_ip}")
         return override_ip
     
-    # Basic IP detection using socket connection
+    # Basic IP detection using socket connection: connecting a UDP socket only asks the
+    # kernel for a route, no packet is sent, and unlike resolving the hostname it never
+    # returns a loopback address from /etc/hosts
     try:
         with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
             # Connect to a remote address to determine our local IP
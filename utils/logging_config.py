@@ -5,13 +5,45 @@ Centralized logging configuration for the Relator system
 import logging
 import os
 
+# Client libraries muted to WARNING unless running verbose
+_QUIET_LOGGERS = (
+    "Discovery Client",
+    "urllib3",
+    "requests",
+    "uvicorn",
+    "uvicorn.access",
+    # Silence OpenAI HTTP request logs
+    "openai",
+    "httpx",
+    "httpcore",
+)
+
+# Important service logs always kept at INFO level
+_SERVICE_LOGGERS = (
+    "Discovery Utils",
+    "Discovery Server",
+    "Module A",
+    "Module B",
+    "Module C",
+    "Module D",
+)
+
+_CONFIGURED = False
+
 def setup_logging(verbose: bool = None):
     """
     Setup logging configuration for the entire application
     
+    Only the first call has an effect, so every entrypoint can call it safely.
+    
     Args:
         verbose: If True, shows DEBUG level logs. If None, uses VERBOSE env var
     """
+    global _CONFIGURED
+    if _CONFIGURED:
+        return
+    _CONFIGURED = True
+    
     # Check environment variable if not explicitly set
     if verbose is None:
         verbose = os.getenv("VERBOSE", "false").lower() in ("true", "1", "yes")
@@ -26,20 +58,8 @@ def setup_logging(verbose: bool = None):
     # Configure specific loggers
     if not verbose:
         # In normal mode, reduce noise from client libraries
-        logging.getLogger("Discovery Client").setLevel(logging.WARNING)
-        logging.getLogger("urllib3").setLevel(logging.WARNING)
-        logging.getLogger("requests").setLevel(logging.WARNING)
-        logging.getLogger("uvicorn").setLevel(logging.WARNING)
-        logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
-        # Silence OpenAI HTTP request logs
-        logging.getLogger("openai").setLevel(logging.WARNING)
-        logging.getLogger("httpx").setLevel(logging.WARNING)
-        logging.getLogger("httpcore").setLevel(logging.WARNING)
+        for name in _QUIET_LOGGERS:
+            logging.getLogger(name).setLevel(logging.WARNING)
     
-    # Always keep important service logs at INFO level
-    logging.getLogger("Discovery Utils").setLevel(logging.INFO)
-    logging.getLogger("Discovery Server").setLevel(logging.INFO)
-    logging.getLogger("Module A").setLevel(logging.INFO)
-    logging.getLogger("Module B").setLevel(logging.INFO)
-    logging.getLogger("Module C").setLevel(logging.INFO)
-    logging.getLogger("Module D").setLevel(logging.INFO) 
\ No newline at end of file
+    for name in _SERVICE_LOGGERS:
+        logging.getLogger(name).setLevel(logging.INFO)
@@ -1,10 +1,17 @@
 import os
 from dotenv import load_dotenv
 
+load_dotenv(override=True)  # Parsed once at import; call refresh_env() to pick up edits to .env
+
+
+def refresh_env():
+    """Reload environment variables from the .env file."""
+    load_dotenv(override=True)
+
+
 def get_env_var(name, default=None):
     """
     Get an environment variable with a default value.
-    Reloads environment variables from .env file each time.
+    Values from the .env file are loaded once at import, see refresh_env().
     """
-    load_dotenv(override=True)  # Reload environment variables
-    return os.getenv(name, default) 
\ No newline at end of file
+    return os.getenv(name, default)